@@ -0,0 +1,260 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Benchmarks of revelationcli on synthetic revelation databases.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import revelationcli
+
+PASSWORD = 'benchmark'
+
+
+def get_arguments():
+    """ Handle the command line arguments given to this program """
+    parser = argparse.ArgumentParser(description='Benchmarks of \
+        revelationcli on synthetic revelation databases.')
+    parser.add_argument('--entries', type=int, nargs='+',
+        default=[1000, 10000],
+        help='Number of passwords in the generated databases \
+        (default: 1000 10000).')
+    parser.add_argument('--depth', type=int, default=3,
+        help='Number of levels of folders (default: 3).')
+    parser.add_argument('--fanout', type=int, default=5,
+        help='Number of sub-folders of each folder (default: 5).')
+    parser.add_argument('--repeat', type=int, default=5,
+        help='Number of times each operation is timed (default: 5).')
+    parser.add_argument('--decrypt', choices=['memory', 'file'],
+        default='memory',
+        help='Whether the database is parsed from plain XML in memory \
+        or saved and decrypted from a file using revelation \
+        (default: memory).')
+    parser.add_argument('--snapshot', action='store_true',
+        help='Run the read-only operations on an EntrySnapshot.')
+    parser.add_argument('--output', default=None,
+        help='File to which the results are written as JSON \
+        (default: stdout).')
+    parser.add_argument('--compare', default=None,
+        help='JSON results of a previous run to compare to.')
+    return parser.parse_args()
+
+
+def generate_store(entries, depth, fanout):
+    """ Returns an EntryStore with the given number of passwords spread
+    over a tree of folders, along with the paths of the folders and of
+    the passwords created.
+    :arg entries, the number of passwords to create.
+    :arg depth, the number of levels of folders.
+    :arg fanout, the number of sub-folders of each folder.
+    """
+    from revelation import data, entry
+
+    store = data.EntryStore()
+    folders = [(None, '')]
+    leaves = folders
+    for lvl in range(depth):
+        children = []
+        for parent, path in leaves:
+            for cnt in range(fanout):
+                folder = entry.FolderEntry()
+                folder.name = 'folder-%d-%d' % (lvl, cnt)
+                children.append((store.add_entry(folder, parent),
+                    '%s/%s' % (path, folder.name)))
+        folders.extend(children)
+        leaves = children
+
+    paths = []
+    for cnt in range(entries):
+        parent, path = leaves[cnt % len(leaves)]
+        password = entry.GenericEntry()
+        password.name = 'password-%d' % cnt
+        password.description = 'Account number %d of host-%d' % (
+            cnt, cnt % 97)
+        for field in password.fields:
+            if field.name == 'Password':
+                field.value = 'secret-%d' % cnt
+            else:
+                field.value = '%s-%d' % (field.name.lower(), cnt)
+        store.add_entry(password, parent)
+        paths.append('%s/%s' % (path, password.name))
+    return store, [path for _, path in folders[1:]], paths
+
+
+def save_store(store):
+    """ Save the given EntryStore in a temporary encrypted revelation
+    file and returns its name.
+    :arg store, the EntryStore to save.
+    """
+    from revelation import datahandler
+    from revelation.io import DataFile
+
+    handler = getattr(datahandler, 'Revelation2', None) \
+        or datahandler.Revelation
+    dbfile = tempfile.mkstemp(suffix='.rvl')[1]
+    DataFile(handler).save(store, dbfile, password=PASSWORD)
+    return dbfile
+
+
+def timeit(func, repeat):
+    """ Call the given function several times with its output discarded
+    and returns statistics on the time it took.
+    :arg func, the function to time.
+    :arg repeat, the number of times to call the function.
+    """
+    times = []
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        for _ in range(repeat):
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return {'min': min(times), 'mean': sum(times) / len(times),
+        'max': max(times), 'repeat': repeat}
+
+
+def run(entries, args):
+    """ Run the benchmarks on a database with the given number of
+    passwords and returns the results.
+    :arg entries, the number of passwords of the database.
+    :arg args, the command line arguments.
+    """
+    start = time.time()
+    store, folders, paths = generate_store(entries, args.depth,
+        args.fanout)
+    results = {'generate': {'min': time.time() - start, 'repeat': 1}}
+
+    cli = revelationcli.RevelationCli()
+    dbfile = None
+    if args.decrypt == 'file':
+        dbfile = save_store(store)
+        revelationcli.getpass.getpass = lambda *args: PASSWORD
+
+        def load():
+            cli.dbfile = dbfile
+            cli.dbdata = revelationcli.read_file(dbfile)
+            return cli.read_revelation_file()
+    else:
+        # Without encryption, still time the parsing of the database
+        from revelation import datahandler
+        xml = datahandler.RevelationXML().export_data(store)
+
+        def load():
+            return datahandler.RevelationXML().import_data(xml)
+
+    try:
+        results['read_revelation_file'] = timeit(load, args.repeat)
+        cli.passwords = load()
+        if args.snapshot:
+            start = time.time()
+            cli.passwords = revelationcli.EntrySnapshot(cli.passwords)
+            results['snapshot'] = {'min': time.time() - start, 'repeat': 1}
+
+        results['show_tree'] = timeit(cli.show_tree, args.repeat)
+        results['audit'] = timeit(cli.audit, args.repeat)
+        name = paths[-1].rsplit('/', 1)[1]
+        results['lookup_name'] = timeit(
+            lambda: cli.find_password(name), args.repeat)
+        results['lookup_path'] = timeit(
+            lambda: cli.find_password(paths[-1]), args.repeat)
+
+        shell = []
+        results['shell_start'] = timeit(lambda: shell.append(
+            revelationcli.RevelationInteractive(cli.passwords, dbfile,
+                cli.handler)), 1)
+        shell = shell[0]
+        results['find_first'] = timeit(
+            lambda: shell.do_find('host-5'), 1)
+        results['find'] = timeit(
+            lambda: shell.do_find('host-5 account'), args.repeat)
+
+        def cd():
+            shell.do_cd(folders[-1])
+            shell.do_cd('/')
+        results['do_cd'] = timeit(cd, args.repeat)
+
+        shell.do_cd(folders[-1])
+        results['complete_view'] = timeit(
+            lambda: shell.complete_view('password-1', 'view password-1',
+                5, 15), args.repeat)
+        shell.do_cd('/')
+        results['complete_cd'] = timeit(
+            lambda: shell.complete_cd('fol', 'cd fol', 3, 6), args.repeat)
+    finally:
+        if dbfile:
+            os.unlink(dbfile)
+    return results
+
+
+def compare(results, previous):
+    """ Prints the ratio between the minimum time of each benchmark and
+    the one of a previous run.
+    :arg results, the results of the current run.
+    :arg previous, the results of the previous run.
+    """
+    for size, benchs in sorted(results['results'].items()):
+        old = previous['results'].get(size, {})
+        for name, stats in sorted(benchs.items()):
+            if name in old and old[name]['min']:
+                print '%8s %-22s %10.6fs %7.2fx' % (size, name,
+                    stats['min'], stats['min'] / old[name]['min'])
+
+
+def main():
+    """ Main function, run the benchmarks asked for. """
+    args = get_arguments()
+    results = {
+        'python': platform.python_version(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': {'depth': args.depth, 'fanout': args.fanout,
+            'repeat': args.repeat, 'decrypt': args.decrypt,
+            'snapshot': args.snapshot},
+        'results': {},
+    }
+    for entries in args.entries:
+        results['results'][str(entries)] = run(entries, args)
+
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        stream = open(args.output, 'w')
+        stream.write(output + '\n')
+        stream.close()
+    else:
+        print output
+    if args.compare:
+        stream = open(args.compare)
+        compare(results, json.load(stream))
+        stream.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -23,32 +23,65 @@ You should have received a copy of the GNU General Public License
 along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
 """
 
-from revelation.datahandler import detect_handler
-from revelation.io import DataFile
-from revelation import data
-
 import argparse
+import bisect
 import cmd
 import ConfigParser
+import cPickle
+import itertools
+import contextlib
+import csv
+import errno
 import getpass
+import hashlib
+import hmac
+import json
 import logging
+import posixpath
+import Queue
+import re
+import socket
+import struct
+import subprocess
 import sys
 import os
-from warnings import warn
-
-TKIMPORT = True
-try:
-    from Tkinter import Tk
-except ImportError:
-    TKIMPORT = False
+import tempfile
+import threading
+import time
+import zlib
+from array import array
 
-# Initial simple logging stuff
-logging.basicConfig()
 LOG = logging.getLogger('revelationcli')
-if '--debug' in sys.argv:
-    LOG.setLevel(logging.DEBUG)
-elif '--verbose' in sys.argv:
-    LOG.setLevel(logging.INFO)
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+# Passwords reported as weak by the audit whatever their length
+COMMON_PASSWORDS = set(['password', 'passw0rd', '123456', '12345678',
+    '123456789', 'qwerty', 'azerty', 'abc123', 'letmein', 'welcome',
+    'admin', 'root', 'changeme', 'secret', 'iloveyou', 'monkey',
+    'dragon', 'master', 'trustno1', 'football'])
+
+
+def setup_logging():
+    """ Initial simple logging stuff """
+    logging.basicConfig()
+    if '--debug' in sys.argv:
+        LOG.setLevel(logging.DEBUG)
+    elif '--verbose' in sys.argv:
+        LOG.setLevel(logging.INFO)
+
+
+def positive_int(value):
+    """ Returns the given command line value as an integer, refusing the
+    values lower than 1.
+    :arg value, the value given on the command line.
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(
+            '%r is not a positive integer' % value)
+    return number
 
 
 def get_arguments():
@@ -61,18 +94,96 @@ def get_arguments():
     parser.add_argument('-i', '--interactive',
                         help='Enter PyPass interactive mode',
                         action='store_true', default=False)
+    parser.add_argument('-m', '--mount', action='append', default=[],
+        metavar='DATABASE',
+        help='Another revelation database to open, the databases are \
+        decrypted in parallel and each is shown as a top-level folder. \
+        Can be given several times.')
     parser.add_argument('password_name', nargs='?', default=None,
         help='Name of the password to retrieve from the revelation \
-        database.')
+        database, or its path (ie: Folder/Sub/Name).')
     parser.add_argument('--show', action='store_true',
         help='Actually prints the password to the terminal')
     parser.add_argument('--show-tree', action='store_true',
         dest="show_tree",
         help='Prints the tree of passwords and folder in the \
         terminal.')
+    parser.add_argument('--tree-path', default=None, dest="tree_path",
+        metavar='PATH',
+        help='Only prints the tree of the given folder \
+        (ie: Folder/Sub).')
+    parser.add_argument('--depth', type=positive_int, default=None,
+        help='Number of levels of the tree to print.')
+    parser.add_argument('--limit', type=positive_int, default=None,
+        help='Maximum number of entries of the tree to print.')
     parser.add_argument('--show-folders', action='store_true',
         dest="show_folders",
         help='Prints the tree of folders in the terminal.')
+    parser.add_argument('--batch', default=None, metavar='FILE',
+        help='Retrieve all the passwords whose name or path are listed, \
+        one per line, in the given file (- for stdin) and print them as \
+        JSON lines.')
+    parser.add_argument('--export', choices=['json', 'csv'], default=None,
+        help='Prints every entry of the database as JSON lines or CSV, \
+        the passwords are only included with --show.')
+    parser.add_argument('--fields', default=None,
+        help='Comma separated list of the fields to export (default: \
+        all).')
+    parser.add_argument('--autosave', type=int, default=None,
+        metavar='SECONDS',
+        help='In interactive mode, save the database in the background \
+        once it has been modified and left idle for the given number of \
+        seconds.')
+    parser.add_argument('--cache', action='store_true',
+        help='Keep an encrypted copy of the parsed database in \
+        ~/.cache/revelationcli to open it faster while it is unchanged. \
+        Requires Python 2.7.8 or later, not used with --mount.')
+    parser.add_argument('--clipboard', default='auto',
+        choices=['auto', 'xclip', 'xsel', 'tk', 'memory'],
+        help='How the copy command of the interactive mode accesses the \
+        clipboard (default: auto, xclip or xsel if installed, otherwise \
+        Tk).')
+    parser.add_argument('--clipboard-timeout', type=int, default=30,
+        dest="clipboard_timeout", metavar='SECONDS',
+        help='Number of seconds after which a copied password is removed \
+        from the clipboard, 0 to keep it (default: 30). The Tk clipboard \
+        can not be cleared, it requires 0.')
+    parser.add_argument('--diff', default=None, metavar='DATABASE',
+        help='Prints the entries added (+), removed (-) and changed (~) \
+        in the given database compared to the opened one.')
+    parser.add_argument('--merge', default=None, metavar='FILE',
+        help='With --diff, saves into the given file the opened database \
+        with the entries added and changed in the other one.')
+    parser.add_argument('--audit', action='store_true',
+        help='Reports the passwords used more than once, the weak ones \
+        and the ones not changed for --max-age days, the passwords are \
+        only printed with --show.')
+    parser.add_argument('--max-age', type=int, default=365,
+        dest="max_age", metavar='DAYS',
+        help='Age in days after which the audit reports a password as \
+        old (default: 365).')
+    parser.add_argument('--snapshot', action='store_true',
+        help='Convert the database into a compact read-only copy once \
+        loaded, reducing the memory used and speeding up the lookups.')
+    parser.add_argument('--agent', action='store_true',
+        help='Start an agent keeping the database unlocked in memory so \
+        that the next lookups do not ask for the password.')
+    parser.add_argument('--agent-timeout', type=int, default=900,
+        dest="agent_timeout", metavar='SECONDS',
+        help='Number of seconds of inactivity after which the agent \
+        stops (default: 900).')
+    parser.add_argument('--stop-agent', action='store_true',
+        dest="stop_agent",
+        help='Stop the running agent.')
+    parser.add_argument('--no-agent', action='store_true',
+        dest="no_agent",
+        help='Do not ask the running agent for the password.')
+    parser.add_argument('--timings', action='store_true',
+        help='Prints the time and the peak memory used by each step on \
+        exit.')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+        help='Profiles the program and writes the statistics to the \
+        given file (see the pstats module).')
     parser.add_argument('--verbose', action='store_true',
                 help="Gives more info about what's going on")
     parser.add_argument('--debug', action='store_true',
@@ -85,12 +196,888 @@ def read_file(dbfile):
     :arg dbfile, the file to open and read
     """
     LOG.debug('Open revelation database: %s', dbfile)
-    flux = open(dbfile)
+    flux = open(dbfile, 'rb')
     data = flux.read()
     flux.close()
     return data
 
 
+def is_secret(field):
+    """ Returns whether the given field holds a secret, such as a password
+    or a PIN, which is only printed or exported if asked for.
+    The datatype is used as the name of the field is translated.
+    :arg field, the field of an entry.
+    """
+    # The value of revelation.entry.DATATYPE_PASSWORD
+    return field.datatype == 'password'
+
+
+def tokenize(text):
+    """ Returns the list of the lower case words of a text.
+    :arg text, the text to split into words.
+    """
+    if isinstance(text, str):
+        text = text.decode('utf-8', 'replace')
+    return TOKEN_RE.findall(text.lower())
+
+
+def walk_entries(passwords, itera, folder_only=False, recursive=True,
+        max_depth=None):
+    """ Iterates over an element of the EntryStore, its siblings and their
+    children using an explicit stack. Yields for each element a tuple
+    (depth, entry, iterator), the depth of the given element being 0, in
+    the order of the tree.
+    :arg passwords, the EntryStore to browse.
+    :arg itera, an iterator (GtkTreeIter) for the EntryStore.
+    :kwarg folder_only, a boolean specifying whether only the folders
+    should be returned or not.
+    :kwarg recursive, a boolean specifying whether to browse the children
+    of the folders or not.
+    :kwarg max_depth, the number of levels to browse, defaults to all.
+    """
+    stack = [(0, itera)]
+    while stack:
+        depth, itera = stack.pop()
+        if itera is None:
+            continue
+        entry = passwords.get_value(itera, 2)
+        stack.append((depth, passwords.iter_next(itera)))
+        if recursive and entry.typename == 'Folder' and \
+                (max_depth is None or depth + 1 < max_depth):
+            stack.append((depth + 1, passwords.iter_children(itera)))
+        if not folder_only or entry.typename == 'Folder':
+            yield depth, entry, itera
+
+
+def write_lines(lines, chunk=1000):
+    """ Writes the given lines to the terminal in chunks rather than one
+    at a time.
+    :arg lines, an iterable of the lines to write.
+    :kwarg chunk, the number of lines written at once.
+    """
+    encoding = sys.stdout.encoding or 'utf-8'
+    buf = []
+    for line in lines:
+        if isinstance(line, unicode):
+            line = line.encode(encoding, 'replace')
+        buf.append(line)
+        if len(buf) >= chunk:
+            sys.stdout.write('\n'.join(buf) + '\n')
+            buf = []
+    if buf:
+        sys.stdout.write('\n'.join(buf) + '\n')
+    sys.stdout.flush()
+
+
+class SearchIndex(object):
+    """ An inverted index of the words present in the name, description
+    and non-secret fields of the entries of an EntryStore, used to find
+    entries by their words or the start of their words.
+    The index is built on first use and rebuilt whenever the store is
+    modified.
+    """
+
+    def __init__(self, passwords):
+        """ Default constructor, keeps track of the modifications made to
+        the EntryStore.
+        :arg passwords, the EntryStore to index.
+        """
+        self.paths = []
+        self.iters = []
+        self.postings = {}
+        self.tokens = []
+        self.text_tokens = {}
+        self.rebind(passwords)
+
+    def rebind(self, passwords):
+        """ Index another EntryStore, typically the database reloaded from
+        the disk. The words of the entries which did not change are not
+        extracted again when the index is rebuilt.
+        :arg passwords, the EntryStore to index.
+        """
+        self.passwords = passwords
+        self.dirty = True
+        for signal in ('row-inserted', 'row-changed', 'row-deleted',
+                'rows-reordered'):
+            self.passwords.connect(signal, self.invalidate)
+
+    def invalidate(self, *args):
+        """ Mark the index as out of date, it will be rebuilt on its next
+        use.
+        """
+        self.dirty = True
+
+    def build(self):
+        """ Walk the EntryStore once and index the words of each entry
+        along with its full path.
+        """
+        LOG.debug('Build the search index of the database.')
+        text_tokens = self.text_tokens
+        self.paths = []
+        self.iters = []
+        self.postings = {}
+        self.text_tokens = {}
+        folders = ['']
+        for depth, entry, itera in walk_entries(self.passwords,
+                self.passwords.get_iter_first()):
+            del folders[depth + 1:]
+            path = '%s/%s' % (folders[depth], entry.name)
+            if entry.typename == 'Folder':
+                folders.append(path)
+            record = len(self.paths)
+            self.paths.append(path)
+            self.iters.append(itera)
+            text = [entry.name, entry.description or '']
+            for field in entry.fields:
+                if field.value and not is_secret(field):
+                    text.append(field.value)
+            text = ' '.join(text)
+            tokens = text_tokens.get(text)
+            if tokens is None:
+                tokens = tokenize(text)
+            self.text_tokens[text] = tokens
+            for token in tokens:
+                self.postings.setdefault(token, set()).add(record)
+        self.tokens = sorted(self.postings)
+        self.dirty = False
+
+    def _match_prefix(self, prefix):
+        """ Returns the set of the entries having a word starting with
+        the given prefix.
+        :arg prefix, the lower case start of the words to search.
+        """
+        matches = set()
+        start = bisect.bisect_left(self.tokens, prefix)
+        for token in self.tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            matches.update(self.postings[token])
+        return matches
+
+    def search(self, query):
+        """ Returns the list of (path, iterator) of the entries having a
+        word starting with each of the terms of the query, in the order of
+        the tree.
+        :arg query, the terms to search for separated by spaces.
+        """
+        if self.dirty:
+            self.build()
+        terms = tokenize(query)
+        if not terms:
+            return []
+        terms.sort(key=len, reverse=True)
+        matches = self._match_prefix(terms[0])
+        for term in terms[1:]:
+            if not matches:
+                break
+            matches &= self._match_prefix(term)
+        return [(self.paths[record], self.iters[record])
+            for record in sorted(matches)]
+
+
+class SnapshotField(object):
+    """ A field of an entry of an EntrySnapshot. """
+    __slots__ = ('id', 'name', 'datatype', 'value')
+
+    def __init__(self, fieldtype, value):
+        self.id, self.name, self.datatype = fieldtype
+        self.value = value
+
+    def __str__(self):
+        return self.value
+
+
+class SnapshotEntry(object):
+    """ An entry of an EntrySnapshot, its attributes are read from the
+    snapshot when accessed.
+    """
+    __slots__ = ('snapshot', 'index')
+
+    def __init__(self, snapshot, index):
+        self.snapshot = snapshot
+        self.index = index
+
+    @property
+    def name(self):
+        return self.snapshot.names[self.index]
+
+    @property
+    def typename(self):
+        return self.snapshot.typenames[self.snapshot.types[self.index]]
+
+    @property
+    def description(self):
+        return self.snapshot.descriptions[self.index]
+
+    @property
+    def updated(self):
+        return self.snapshot.updated[self.index]
+
+    @property
+    def fields(self):
+        snapshot = self.snapshot
+        start = snapshot.field_offsets[self.index]
+        end = snapshot.field_offsets[self.index + 1]
+        return [SnapshotField(snapshot.fieldtypes[snapshot.field_types[cnt]],
+            snapshot.field_values[cnt]) for cnt in xrange(start, end)]
+
+    def copy(self):
+        return self
+
+
+class EntrySnapshot(object):
+    """ A compact, read-only copy of an EntryStore stored in arrays and
+    detached from GTK.
+    The elements are stored in the order of the tree and their index is
+    used as iterator, it provides the methods of the EntryStore used to
+    browse it.
+    """
+
+    def __init__(self, passwords):
+        """ Default constructor, copies the given EntryStore.
+        :arg passwords, the EntryStore to copy.
+        """
+        LOG.debug('Build the snapshot of the database.')
+        self.names = []
+        self.descriptions = []
+        self.typenames = []
+        self.types = array('H')
+        self.updated = array('d')
+        self.parents = array('l')
+        self.first_child = array('l')
+        self.next_sibling = array('l')
+        self.fieldtypes = []
+        self.field_types = array('H')
+        self.field_values = []
+        self.field_offsets = array('l', [0])
+        typenames = {}
+        fieldtypes = {}
+        # The index of the last element seen at each depth
+        last = []
+        for depth, entry, _ in walk_entries(passwords,
+                passwords.get_iter_first()):
+            index = len(self.names)
+            del last[depth + 1:]
+            if len(last) == depth + 1:
+                self.next_sibling[last[depth]] = index
+                last[depth] = index
+            else:
+                last.append(index)
+            parent = last[depth - 1] if depth else -1
+            if parent != -1 and self.first_child[parent] == -1:
+                self.first_child[parent] = index
+            self.parents.append(parent)
+            self.first_child.append(-1)
+            self.next_sibling.append(-1)
+            self.names.append(entry.name)
+            self.descriptions.append(entry.description)
+            self.updated.append(float(getattr(entry, 'updated', 0) or 0))
+            if entry.typename not in typenames:
+                typenames[entry.typename] = len(self.typenames)
+                self.typenames.append(entry.typename)
+            self.types.append(typenames[entry.typename])
+            for field in entry.fields:
+                if not field.value:
+                    continue
+                fieldtype = (field.id, field.name, field.datatype)
+                if fieldtype not in fieldtypes:
+                    fieldtypes[fieldtype] = len(self.fieldtypes)
+                    self.fieldtypes.append(fieldtype)
+                self.field_types.append(fieldtypes[fieldtype])
+                self.field_values.append(field.value)
+            self.field_offsets.append(len(self.field_values))
+
+    def __len__(self):
+        return len(self.names)
+
+    def connect(self, signal, callback, *args):
+        """ The snapshot is never modified, nothing is ever emitted. """
+        return 0
+
+    def get_iter_first(self):
+        return 0 if self.names else None
+
+    def iter_next(self, itera):
+        sibling = self.next_sibling[itera]
+        return sibling if sibling != -1 else None
+
+    def iter_children(self, itera):
+        if itera is None:
+            return self.get_iter_first()
+        child = self.first_child[itera]
+        return child if child != -1 else None
+
+    def iter_has_child(self, itera):
+        return self.first_child[itera] != -1
+
+    def iter_parent(self, itera):
+        parent = self.parents[itera]
+        return parent if parent != -1 else None
+
+    def get_value(self, itera, column):
+        return SnapshotEntry(self, itera)
+
+    def get_entry(self, itera):
+        return SnapshotEntry(self, itera)
+
+    def foreach(self, func, user_data):
+        for itera in xrange(len(self.names)):
+            if func(self, None, itera, user_data):
+                break
+
+
+def peak_memory():
+    """ Returns the peak memory used by the process (in KiB on Linux), or
+    None if it cannot be known.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class PhaseTimer(object):
+    """ Records the time spent and the peak memory used by each phase of
+    the program.
+    """
+
+    def __init__(self):
+        self.phases = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Context manager recording the time spent in its block.
+        :arg name, the name of the phase.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.time() - start, peak_memory()))
+
+    def report(self, stream=None):
+        """ Prints the phases recorded.
+        :kwarg stream, the file to write to, defaults to stderr.
+        """
+        stream = stream or sys.stderr
+        stream.write('%-30s %10s %16s\n' % ('Phase', 'Time (s)',
+            'Peak memory (KiB)'))
+        for name, duration, memory in self.phases:
+            stream.write('%-30s %10.4f %16s\n' % (name, duration,
+                memory if memory is not None else '-'))
+        stream.write('%-30s %10.4f\n' % ('Total',
+            sum(duration for _, duration, _ in self.phases)))
+
+
+def detect_database_handler(dbdata):
+    """ Returns the handler of the format of a revelation database.
+    The whole content is given to revelation, as some handlers only
+    check the length of the data.
+    :arg dbdata, the content of the database.
+    """
+    # Imported here as the revelation modules pull in GTK
+    from revelation.datahandler import detect_handler
+    return detect_handler(dbdata)
+
+
+def load_database(dbfile, password):
+    """ Decrypt a revelation database and returns its EntryStore along
+    with the handler of its format.
+    :arg dbfile, the database to decrypt.
+    :arg password, the password of the database.
+    """
+    dbdata = read_file(dbfile)
+    handler = detect_database_handler(dbdata)
+    loader = handler()
+    loader.check(dbdata)
+    return loader.import_data(dbdata, password), handler
+
+
+def decrypt_database(dbfile, password):
+    """ Decrypt a revelation database and returns its content as plain
+    revelation XML, which unlike the EntryStore can be sent back from
+    another process.
+    :arg dbfile, the database to decrypt.
+    :arg password, the password of the database.
+    """
+    from revelation import datahandler
+    store = load_database(dbfile, password)[0]
+    return datahandler.RevelationXML().export_data(store)
+
+
+def hash_entries(passwords):
+    """ Returns a dictionnary of the path of each entry of an EntryStore
+    to a hash of its type, description and fields, its iterator and the
+    path of its folder ('' at the root), along with the list of the paths
+    in the order of the tree.
+    Entries having the same name in a folder get their rank appended to
+    their path (ie: /Folder/Name[2]).
+    :arg passwords, the EntryStore to hash.
+    """
+    hashes = {}
+    order = []
+    folders = ['']
+    for depth, entry, itera in walk_entries(passwords,
+            passwords.get_iter_first()):
+        del folders[depth + 1:]
+        path = '%s/%s' % (folders[depth], entry.name)
+        cnt = 1
+        while path in hashes:
+            cnt += 1
+            path = '%s/%s[%s]' % (folders[depth], entry.name, cnt)
+        if entry.typename == 'Folder':
+            folders.append(path)
+        digest = hashlib.sha1()
+        for value in [entry.typename, entry.description or ''] + sorted(
+                '%s=%s' % (field.name, field.value)
+                for field in entry.fields if field.value):
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            digest.update(value + '\0')
+        hashes[path] = (digest.digest(), itera, folders[depth])
+        order.append(path)
+    return hashes, order
+
+
+def decrypt_worker(args):
+    """ Decrypt a database in a worker process, returns the database, its
+    content and either None, 'io' if it could not be read or the error
+    raised while decrypting it.
+    :arg args, a tuple of the database and its password.
+    """
+    dbfile, password = args
+    try:
+        return dbfile, decrypt_database(dbfile, password), None
+    except IOError, exc:
+        return dbfile, None, 'io'
+    except Exception, exc:
+        return dbfile, None, str(exc) or exc.__class__.__name__
+
+
+def password_weaknesses(password):
+    """ Returns the list of the reasons why a password is weak, empty if
+    it is not.
+    :arg password, the password to check.
+    """
+    reasons = []
+    if len(password) < 8:
+        reasons.append('short')
+    classes = 0
+    for check in (str.islower, str.isupper, str.isdigit):
+        if any(check(char) for char in password):
+            classes += 1
+    if any(not char.isalnum() for char in password):
+        classes += 1
+    if classes < 3:
+        reasons.append('%s kind(s) of characters' % classes)
+    if password.lower() in COMMON_PASSWORDS or len(set(password)) < 3:
+        reasons.append('common')
+    return reasons
+
+
+def get_agent_socket():
+    """ Returns the path of the Unix socket the agent listens to, it can
+    be set using the REVELATIONCLI_AGENT_SOCK environment variable.
+    """
+    if os.environ.get('REVELATIONCLI_AGENT_SOCK'):
+        return os.environ['REVELATIONCLI_AGENT_SOCK']
+    return os.path.join(tempfile.gettempdir(),
+        'revelationcli-%s' % os.getuid(), 'agent.sock')
+
+
+def agent_request(request):
+    """ Send a request to the agent and returns its answer, or None if no
+    agent is running.
+    :arg request, a dictionnary sent to the agent.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    try:
+        try:
+            sock.connect(get_agent_socket())
+            sock.sendall(json.dumps(request) + '\n')
+            answer = sock.makefile().readline()
+        finally:
+            sock.close()
+    except socket.error, exc:
+        LOG.debug('No agent available: %s', exc)
+        return None
+    if not answer:
+        return None
+    return json.loads(answer)
+
+
+class AgentEntry(object):
+    """ An entry of the database as returned by the agent, providing the
+    attributes of the revelation entries used to print them.
+    The values are encoded back to UTF-8, as the ones of the revelation
+    entries, since JSON decodes them as unicode.
+    """
+
+    class Field(object):
+        """ A field of an entry returned by the agent. """
+
+        def __init__(self, name, value, datatype='password'):
+            self.name = name.encode('utf-8')
+            self.value = value.encode('utf-8')
+            self.datatype = datatype
+
+    def __init__(self, name, fields):
+        """ Default constructor.
+        :arg name, the name of the entry.
+        :arg fields, a list of (name, value, datatype) of the fields of
+        the entry, the fields without datatype are kept secret.
+        """
+        self.name = name.encode('utf-8')
+        self.fields = [self.Field(*field) for field in fields]
+
+
+class _AgentHandler(object):
+    """ Handle a single request made to the agent, used as request handler
+    of the SocketServer of the agent.
+    """
+
+    def __init__(self, request, client_address, server):
+        line = request.makefile('rb').readline()
+        try:
+            answer = server.agent.answer(json.loads(line))
+        except ValueError, exc:
+            answer = {'error': 'Invalid request: %s' % exc}
+        request.sendall(json.dumps(answer) + '\n')
+
+
+class RevelationAgent(object):
+    """ An agent keeping an unlocked database in memory and answering the
+    lookups made by revelationcli through a Unix socket until it has been
+    idle for too long.
+    """
+
+    def __init__(self, cli, timeout):
+        """ Default constructor.
+        :arg cli, the RevelationCli instance having loaded the database.
+        :arg timeout, the number of seconds of inactivity after which the
+        agent stops.
+        """
+        self.cli = cli
+        self.timeout = timeout
+        self.dbfiles = [os.path.abspath(dbfile) for dbfile in cli.dbfiles]
+        self.dbstat = self._stat()
+        self.running = False
+        self.server = None
+        self.last = None
+
+    def _stat(self):
+        """ Returns the size and modification time of the databases. """
+        stats = []
+        for dbfile in self.dbfiles:
+            try:
+                stat = os.stat(dbfile)
+            except OSError:
+                return None
+            stats.append((stat.st_size, stat.st_mtime))
+        return stats
+
+    def answer(self, request):
+        """ Returns the answer to the given request.
+        :arg request, a dictionnary with either the 'databases' and 'name'
+        keys to look up a password or 'command' set to 'ping' or 'stop'.
+        """
+        self.last = time.time()
+        if request.get('command') == 'ping':
+            return {'pong': True}
+        elif request.get('command') == 'stop':
+            self.running = False
+            return {'stopped': True}
+        if [os.path.abspath(dbfile) for dbfile in
+                request.get('databases') or []] != self.dbfiles:
+            return {'error': 'Database not loaded in the agent'}
+        if self._stat() != self.dbstat:
+            return {'error': 'Database modified since it was loaded'}
+        # The names of the entries are UTF-8 encoded, JSON gives unicode
+        name = (request.get('name') or u'').encode('utf-8')
+        entries = []
+        for itera in self.cli.find_password(name):
+            entry = self.cli.passwords.get_value(itera, 2)
+            entries.append({'name': entry.name,
+                'fields': [(field.name, field.value, field.datatype)
+                    for field in entry.fields]})
+        return {'entries': entries}
+
+    def start(self):
+        """ Bind the socket of the agent, then fork into the background
+        and serve requests until stopped or idle for too long.
+        """
+        sockpath = get_agent_socket()
+        sockdir = os.path.dirname(sockpath)
+        try:
+            os.makedirs(sockdir, 0700)
+        except OSError, exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        if os.stat(sockdir).st_uid != os.getuid():
+            raise IOError('%s is not owned by the current user' % sockdir)
+        os.chmod(sockdir, 0700)
+        if os.path.exists(sockpath):
+            if agent_request({'command': 'ping'}) is not None:
+                raise IOError('An agent is already running on %s' % sockpath)
+            os.unlink(sockpath)
+
+        import SocketServer
+        umask = os.umask(0077)
+        try:
+            self.server = SocketServer.UnixStreamServer(sockpath,
+                _AgentHandler)
+        finally:
+            os.umask(umask)
+        self.server.agent = self
+        self.server.timeout = 1
+
+        if os.fork():
+            print 'Agent started on %s' % sockpath
+            return
+        os.setsid()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        try:
+            self.serve()
+        finally:
+            self.server.server_close()
+            os.unlink(sockpath)
+            os._exit(0)
+
+    def serve(self):
+        """ Serve the requests until stopped or idle for too long. """
+        self.running = True
+        self.last = time.time()
+        while self.running and time.time() - self.last < self.timeout:
+            self.server.handle_request()
+
+
+def write_atomic(filename, content):
+    """ Write the content into a temporary file next to the given file
+    then rename it over the given file, so that the file is never left
+    half written.
+    :arg filename, the file to write.
+    :arg content, the content to write into the file.
+    """
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname)
+    try:
+        try:
+            os.write(fd, content)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        if os.path.exists(filename):
+            os.chmod(tmpname, os.stat(filename).st_mode & 07777)
+        os.rename(tmpname, filename)
+    except:
+        os.unlink(tmpname)
+        raise
+
+
+class TreeCache(object):
+    """ An on-disk cache of the parsed tree of a database, encrypted with
+    a key derived from the password of the database and invalidated when
+    the size, the modification time or the content of the database
+    change.
+    """
+
+    magic = 'RVLCACHE1'
+    header = struct.Struct('!Qd32s16s16s')
+    iterations = 10000
+
+    def __init__(self, dbfile):
+        """ Default constructor.
+        :arg dbfile, the database whose tree is cached.
+        """
+        self.dbfile = os.path.abspath(dbfile)
+        self.filename = os.path.join(os.path.expanduser(
+            '~/.cache/revelationcli'),
+            hashlib.sha1(self.dbfile).hexdigest() + '.cache')
+
+    def _fingerprint(self, dbdata):
+        """ Returns the size, modification time and hash of the database.
+        :arg dbdata, the content of the database.
+        """
+        stat = os.stat(self.dbfile)
+        return (stat.st_size, stat.st_mtime,
+            hashlib.sha256(dbdata).digest())
+
+    def _keys(self, password, salt):
+        """ Returns the encryption and the authentication keys derived
+        from the password.
+        """
+        key = hashlib.pbkdf2_hmac('sha256', password, salt,
+            self.iterations, 64)
+        return key[:32], key[32:]
+
+    def load(self, dbdata, password):
+        """ Returns the EntryStore read from the cache, or None if there
+        is no valid cache for this content and password.
+        :arg dbdata, the content of the database.
+        :arg password, the password of the database.
+        """
+        try:
+            stream = open(self.filename, 'rb')
+        except IOError:
+            return None
+        try:
+            cached = stream.read()
+        finally:
+            stream.close()
+        start = len(self.magic)
+        end = start + self.header.size
+        if cached[:start] != self.magic or len(cached) < end + 32:
+            return None
+        size, mtime, digest, salt, ivec = self.header.unpack(
+            cached[start:end])
+        if (size, mtime, digest) != self._fingerprint(dbdata):
+            LOG.debug('The cache of %s is out of date', self.dbfile)
+            return None
+        enckey, mackey = self._keys(password, salt)
+        mac = hmac.new(mackey, cached[:end] + cached[end + 32:],
+            hashlib.sha256).digest()
+        if not hmac.compare_digest(mac, cached[end:end + 32]):
+            LOG.debug('The cache of %s does not match the password',
+                self.dbfile)
+            return None
+
+        from Crypto.Cipher import AES
+        from revelation import data
+        content = AES.new(enckey, AES.MODE_CBC, ivec).decrypt(
+            cached[end + 32:])
+        content = zlib.decompress(content[:-ord(content[-1])])
+        store = data.EntryStore()
+        parents = [None]
+        for depth, entry in cPickle.loads(content):
+            del parents[depth + 1:]
+            parents.append(store.add_entry(entry, parents[depth]))
+        return store
+
+    def save(self, passwords, dbdata, password):
+        """ Write the given EntryStore into the cache.
+        :arg passwords, the EntryStore to cache.
+        :arg dbdata, the content of the database.
+        :arg password, the password of the database.
+        """
+        from Crypto.Cipher import AES
+        tree = [(depth, entry) for depth, entry, _ in walk_entries(
+            passwords, passwords.get_iter_first())]
+        content = zlib.compress(cPickle.dumps(tree,
+            cPickle.HIGHEST_PROTOCOL))
+        padding = 16 - len(content) % 16
+        content += chr(padding) * padding
+
+        size, mtime, digest = self._fingerprint(dbdata)
+        salt = os.urandom(16)
+        ivec = os.urandom(16)
+        enckey, mackey = self._keys(password, salt)
+        header = self.magic + self.header.pack(size, mtime, digest, salt,
+            ivec)
+        content = AES.new(enckey, AES.MODE_CBC, ivec).encrypt(content)
+        mac = hmac.new(mackey, header + content, hashlib.sha256).digest()
+
+        dirname = os.path.dirname(self.filename)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname, 0700)
+        write_atomic(self.filename, header + mac + content)
+
+
+class CommandClipboard(object):
+    """ Access the clipboard using an external program, xclip or xsel. """
+    threadsafe = True
+    commands = {
+        'xclip': (['xclip', '-selection', 'clipboard', '-in'], None),
+        'xsel': (['xsel', '--clipboard', '--input'],
+            ['xsel', '--clipboard', '--clear']),
+    }
+
+    def __init__(self, name):
+        """ Default constructor.
+        :arg name, the program to use, xclip or xsel.
+        """
+        from distutils.spawn import find_executable
+        if not find_executable(name):
+            raise OSError('%s is not installed' % name)
+        self.copy_command, self.clear_command = self.commands[name]
+
+    def copy(self, text):
+        """ Put the given text in the clipboard. """
+        proc = subprocess.Popen(self.copy_command, stdin=subprocess.PIPE)
+        proc.communicate(text)
+
+    def clear(self):
+        """ Empty the clipboard. """
+        if self.clear_command:
+            subprocess.call(self.clear_command)
+        else:
+            self.copy('')
+
+
+class TkClipboard(object):
+    """ Access the clipboard using a hidden Tk window, which is created
+    once and reused. Tk may only be used from the main thread, so the
+    content can not be cleared after a timeout while the shell waits for
+    a command.
+    The content is only served to the other applications while Tk
+    processes its events, prefer xclip or xsel when they are installed.
+    """
+    threadsafe = False
+
+    def __init__(self):
+        from Tkinter import Tk
+        self.root = Tk()
+        self.root.withdraw()
+
+    def copy(self, text):
+        """ Put the given text in the clipboard. """
+        self.root.clipboard_clear()
+        self.root.clipboard_append(text)
+        self.root.update()
+
+    def clear(self):
+        """ Empty the clipboard. """
+        self.root.clipboard_clear()
+        self.root.update()
+
+
+class MemoryClipboard(object):
+    """ A clipboard only kept in memory, for tests. """
+    threadsafe = True
+
+    def __init__(self):
+        self.content = ''
+
+    def copy(self, text):
+        """ Put the given text in the clipboard. """
+        self.content = text
+
+    def clear(self):
+        """ Empty the clipboard. """
+        self.content = ''
+
+
+def get_clipboard(name='auto'):
+    """ Returns the clipboard backend of the given name.
+    :kwarg name, one of xclip, xsel, tk, memory or auto to use xclip or
+    xsel if installed, otherwise Tk.
+    """
+    from distutils.spawn import find_executable
+    if name == 'memory':
+        return MemoryClipboard()
+    elif name == 'tk':
+        return TkClipboard()
+    elif name != 'auto':
+        return CommandClipboard(name)
+    for command in ('xclip', 'xsel'):
+        if find_executable(command):
+            return CommandClipboard(command)
+    return TkClipboard()
+
+
 class Config(object):
     """ A config class to load/handle configuration file of revelationcli.
     """
@@ -125,6 +1112,144 @@ class Config(object):
         return self.config.get(section, option)
 
 
+class EntryIndex(object):
+    """ An index of the EntryStore mapping the full path of each entry to
+    its iterator, with a map of the children of each folder.
+    The index is built on first use and rebuilt whenever the store is
+    modified.
+    """
+
+    def __init__(self, passwords):
+        """ Default constructor, keeps track of the modifications made to
+        the EntryStore.
+        :arg passwords, the EntryStore to index.
+        """
+        self.passwords = passwords
+        self.paths = {}
+        self.children = {}
+        self.completions = {}
+        self.rebind(passwords)
+
+    def rebind(self, passwords):
+        """ Index another EntryStore, typically the database reloaded from
+        the disk. The parts of the index which did not change are kept
+        when it is rebuilt.
+        :arg passwords, the EntryStore to index.
+        """
+        self.passwords = passwords
+        self.dirty = True
+        for signal in ('row-inserted', 'row-changed', 'row-deleted',
+                'rows-reordered'):
+            self.passwords.connect(signal, self.invalidate)
+
+    def invalidate(self, *args):
+        """ Mark the index as out of date, it will be rebuilt on its next
+        use.
+        """
+        self.dirty = True
+
+    def build(self):
+        """ Walk the EntryStore once and record the path of each entry,
+        and the children of each folder.
+        The sorted names of the folders whose content did not change are
+        kept.
+        """
+        LOG.debug('Build the index of the database.')
+        children = self.children
+        completions = self.completions
+        self.paths = {}
+        self.children = {'/': {}}
+        self.completions = {}
+        folders = ['/']
+        for depth, entry, itera in walk_entries(self.passwords,
+                self.passwords.get_iter_first()):
+            del folders[depth + 1:]
+            path = '%s/%s' % (folders[depth].rstrip('/'), entry.name)
+            self.children[folders[depth]].setdefault(entry.name, itera)
+            self.paths.setdefault(path, itera)
+            if entry.typename == 'Folder':
+                self.children.setdefault(path, {})
+                folders.append(path)
+
+        for path, (subfolders, others) in completions.items():
+            if path not in self.children or \
+                    len(self.children[path]) != len(children[path]):
+                continue
+            if all('%s/%s' % (path.rstrip('/'), name.rstrip('/'))
+                    in self.children for name in subfolders) and \
+                    all(name in self.children[path] for name in others):
+                self.completions[path] = (subfolders, others)
+        self.dirty = False
+
+    def _refresh(self):
+        """ Rebuild the index if the EntryStore changed since it was last
+        built.
+        """
+        if self.dirty:
+            self.build()
+
+    def resolve(self, cwd, name):
+        """ Returns the normalized full path of a name given relatively to
+        a folder or as an absolute path.
+        :arg cwd, the path of the folder the name is relative to.
+        :arg name, the name or path to resolve.
+        """
+        path = posixpath.normpath(posixpath.join(cwd, name))
+        return '/' + path.lstrip('/')
+
+    def get(self, path):
+        """ Returns the iterator of the entry at the given full path or
+        None if there is no such entry.
+        :arg path, the full path of the entry (ie: /Folder/Name).
+        """
+        self._refresh()
+        return self.paths.get(path)
+
+    def get_children(self, path):
+        """ Returns a dictionnary of the name of the children of a folder
+        and their iterator, or None if the path is not a folder.
+        :arg path, the full path of the folder, / being the root.
+        """
+        self._refresh()
+        return self.children.get(path)
+
+    def complete(self, path, prefix, folders=True, passwords=True):
+        """ Returns the sorted names of the children of a folder starting
+        with the given prefix, the names of the folders end with a /.
+        The sorted names of each folder are cached until the EntryStore is
+        modified.
+        :arg path, the full path of the folder, / being the root.
+        :arg prefix, the start of the names to return.
+        :kwarg folders, a boolean specifying whether to return the folders.
+        :kwarg passwords, a boolean specifying whether to return the
+        passwords.
+        """
+        self._refresh()
+        if path not in self.completions:
+            children = self.children.get(path)
+            if children is None:
+                return []
+            subfolders = []
+            others = []
+            for name in children:
+                if '%s/%s' % (path.rstrip('/'), name) in self.children:
+                    subfolders.append(name + '/')
+                else:
+                    others.append(name)
+            self.completions[path] = (sorted(subfolders), sorted(others))
+
+        options = []
+        for names, wanted in zip(self.completions[path],
+                (folders, passwords)):
+            if not wanted:
+                continue
+            cnt = bisect.bisect_left(names, prefix)
+            while cnt < len(names) and names[cnt].startswith(prefix):
+                options.append(names[cnt])
+                cnt += 1
+        return sorted(options)
+
+
 class RevelationCli(object):
     """ RecelationCli class, handling the element needed to search for
     passwords in a revelation database.
@@ -135,72 +1260,68 @@ class RevelationCli(object):
         self.list_element = False
         self.password_name = None
         self.dbfile = None
+        self.dbfiles = []
         self.dbdata = None
         self.passwords = None
         self.handler = None
         self.conf = Config()
+        self.timer = PhaseTimer()
+        self.password = None
+        self.cache = False
 
-    def _browse_entry(self, itera, lvl=None, folder_only=False,
-        iterative=True):
-        """ For a given iterator (position) in the EntryStore, iterates
-        through all the elements.
-        :arg itera, an iterator (GtkTreeIter) for the EntryStore.
-        :kwarg lvl, an int of the Level of the tree we are in.
-        :kwarg folder_only, a boolean specifying whether the output
-        should contain only the folder or not.
-        :kwarg iterative, boolean to iterate over the whole tree or not.
-        """
-        while self.passwords.iter_next(itera):
-            self._see_entry(itera, lvl=lvl, folder_only=folder_only,
-                iterative=iterative)
-            itera = self.passwords.iter_next(itera)
-        self._see_entry(itera, lvl=lvl, folder_only=folder_only,
-            iterative=iterative)
-
-    def _see_entry(self, itera, lvl=None, folder_only=False,
-        iterative=True):
-        """ For a given iterator (position) in the EntryStore, see if the
-        corresponding entry fits our search password.
-        If the entry is a folder, browse it too.
+    def _browse_entry(self, itera, lvl=1, folder_only=False,
+        iterative=True, depth=None, limit=None):
+        """ For a given iterator (position) in the EntryStore, prints the
+        ascii-tree of the element and its siblings.
         :arg itera, an iterator (GtkTreeIter) for the EntryStore.
-        :kwarg lvl, an int of the Level of the tree we are in.
+        :kwarg lvl, an int of the Level of the tree we start at.
         :kwarg folder_only, a boolean specifying whether the output
         should contain only the folder or not.
         :kwarg iterative, boolean to iterate over the whole tree or not.
+        :kwarg depth, the number of levels of the tree to print, defaults
+        to all.
+        :kwarg limit, the maximum number of entries to print, the tree is
+        not browsed any further once reached.
         """
-        entry = self.passwords.get_value(itera, 2)
-        LOG.debug('Entry (%s) : %s', entry.typename, entry.name)
-        if lvl:
-            LOG.debug('Level : %s', lvl)
-            LOG.debug('Folder_only : %s', folder_only)
-            if folder_only and entry.typename == 'Folder':
-                print '  | ' * lvl + '\_ []', entry.name
-            elif not folder_only:
-                if entry.typename == 'Folder':
-                    print '  | ' * lvl + '\_ []', entry.name
+        entries = walk_entries(self.passwords, itera,
+            folder_only=folder_only, recursive=iterative, max_depth=depth)
+        if limit is not None:
+            entries = itertools.islice(entries, limit + 1)
+
+        def lines():
+            for cnt, (dep, entry, _) in enumerate(entries):
+                if limit is not None and cnt == limit:
+                    yield '  ... (limited to %s entries)' % limit
+                elif entry.typename == 'Folder':
+                    yield '  | ' * (lvl + dep) + '\\_ [] ' + entry.name
                 else:
-                    print '  | ' * lvl + '\_ ', entry.name
-        elif entry.name == self.password_name:
-            print '  Name :', entry.name
-            for field in entry.fields:
-                if field.value != "":
-                    if field.name != 'Password':
-                        print '  %s : %s' % (field.name, field.value)
-                    elif self.show:
-                        print '  %s : %s' % (field.name, field.value)
-        if self.passwords.iter_has_child(itera):
-            children = self.passwords.iter_children(itera)
-            if lvl and iterative:
-                self._browse_entry(children, lvl=lvl + 1,
-                    folder_only=folder_only)
-            elif iterative:
-                self._browse_entry(children, folder_only=folder_only)
+                    yield '  | ' * (lvl + dep) + '\\_  ' + entry.name
+        write_lines(lines())
 
     def main(self):
         """ Main function, reads the command line argument and set the
         variables accordingly
         """
+        setup_logging()
         args = get_arguments()
+        profiler = None
+        if args.profile:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            self.run(args)
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.dump_stats(args.profile)
+            if args.timings:
+                self.timer.report()
+
+    def run(self, args):
+        """ Does what was asked on the command line.
+        :arg args, the command line arguments.
+        """
         if args.database:
             self.dbfile = args.database
         elif self.conf.exists():
@@ -208,13 +1329,56 @@ class RevelationCli(object):
                 self.conf.get('revelationcli', 'database'))
         self.password_name = args.password_name
         self.show = args.show
+        self.dbfiles = [self.dbfile] + args.mount
+        self.cache = args.cache
+
+        if args.stop_agent:
+            if agent_request({'command': 'stop'}) is None:
+                print "No agent running"
+                sys.exit(1)
+            return
 
         if not self.dbfile:
             print "No database file specified"
             sys.exit(3)
+        if args.merge and not args.diff:
+            print "--merge requires --diff"
+            sys.exit(3)
+        if self.cache and args.mount:
+            LOG.warning('--cache is not used with --mount')
+            self.cache = False
+        elif self.cache and not hasattr(hashlib, 'pbkdf2_hmac'):
+            LOG.warning('--cache requires Python 2.7.8 or later, ignored')
+            self.cache = False
+        queries = None
+        if args.batch and args.batch != '-':
+            # Read before asking for the password of the database
+            try:
+                queries = self.read_batch(args.batch)
+            except IOError, exc:
+                LOG.debug(exc)
+                print "File could not be found or read"
+                sys.exit(1)
+
+        if self.password_name and not args.interactive and not args.agent \
+                and not args.no_agent:
+            with self.timer.phase('agent lookup'):
+                found = self.get_password_from_agent()
+            if found is not None:
+                if not found:
+                    print 'No password of the name "%s" were found' \
+                        % self.password_name
+                    sys.exit(4)
+                return
+
         try:
-            self.dbdata = read_file(self.dbfile)
-            self.passwords = self.read_revelation_file()
+            if args.mount:
+                self.passwords = self.read_revelation_files(self.dbfiles)
+            else:
+                with self.timer.phase('read_file'):
+                    self.dbdata = read_file(self.dbfile)
+                self.passwords = self.read_revelation_file()
+                self.dbdata = None
         except IOError, exc:
             LOG.debug(exc)
             print "File could not be found or read"
@@ -223,115 +1387,841 @@ class RevelationCli(object):
             LOG.debug(exc)
             print "Wrong password entered"
             sys.exit(2)
+        if args.diff:
+            try:
+                with self.timer.phase('diff'):
+                    merged = self.diff(args.diff, args.merge)
+            except IOError, exc:
+                LOG.debug(exc)
+                print "File could not be found or read"
+                sys.exit(1)
+            except Exception, exc:
+                LOG.debug(exc)
+                print "Wrong password entered"
+                sys.exit(2)
+            if not merged:
+                sys.exit(1)
+            return
+
+        if args.snapshot:
+            with self.timer.phase('snapshot'):
+                self.passwords = EntrySnapshot(self.passwords)
+
+        if args.agent:
+            try:
+                RevelationAgent(self, args.agent_timeout).start()
+            except (IOError, OSError, socket.error), exc:
+                print "The agent could not be started: %s" % exc
+                sys.exit(1)
+            return
 
         if args.interactive:
             try:
-                ppi = RevelationInteractive(self.passwords, self.dbfile,
-                    self.handler)
+                with self.timer.phase('shell start'):
+                    ppi = RevelationInteractive(self.passwords,
+                        None if args.mount else self.dbfile,
+                        self.handler, autosave=args.autosave,
+                        password=self.password, clipboard=args.clipboard,
+                        clipboard_timeout=args.clipboard_timeout)
                 ppi.cmdloop()
             except KeyboardInterrupt:
                 ppi.do_quit(None)
                 print ""
 
-        if args.show_folders:
-            self.show = False
-            self.show_tree(folder_only=True)
+        if args.batch:
+            with self.timer.phase('batch'):
+                if queries is None:
+                    queries = self.read_batch(args.batch)
+                self.run_batch(queries)
+        elif args.audit:
+            with self.timer.phase('audit'):
+                self.audit(show=self.show, max_age=args.max_age)
+        elif args.export:
+            fields = None
+            if args.fields:
+                fields = [field.strip() for field in args.fields.split(',')
+                    if field.strip()]
+            with self.timer.phase('export'):
+                self.export(args.export, fields)
+        elif self.password_name:
+            with self.timer.phase('lookup'):
+                found = self.get_password()
+            if not found:
+                print 'No password of the name "%s" were found' \
+                    % self.password_name
+                sys.exit(4)
         else:
-            self.show_tree()
+            if args.show_folders:
+                self.show = False
+            with self.timer.phase('render tree'):
+                found = self.show_tree(folder_only=args.show_folders,
+                    path=args.tree_path, depth=args.depth,
+                    limit=args.limit)
+            if not found:
+                print 'No folder %s found' % args.tree_path
+                sys.exit(4)
+
+    def _print_password(self, entry):
+        """ Prints the name and the fields of the given entry, the
+        secret fields are only printed if asked for.
+        :arg entry, the entry to print.
+        """
+        print '  Name :', entry.name
+        for field in entry.fields:
+            if field.value != "":
+                if not is_secret(field) or self.show:
+                    print '  %s : %s' % (field.name, field.value)
+
+    def find_password(self, name):
+        """ Search the EntryStore for the password of the given name and
+        returns the list of the iterators found.
+        If the name is a path (ie: Folder/Sub/Name), only the folders on
+        this path are browsed and every entry matching the path is
+        returned. Otherwise, or if nothing is at this path, the search
+        stops at the first entry having exactly this name.
+        :arg name, the name or the path of the password to search.
+        """
+        parts = [part for part in name.split('/') if part]
+        if '/' in name and parts:
+            parents = [None]
+            for folder in parts[:-1]:
+                LOG.debug('Descend into folder : %s', folder)
+                parents = [itera for itera in
+                    self._iter_named(parents, folder) if
+                    self.passwords.get_value(itera, 2).typename == 'Folder']
+            found = list(self._iter_named(parents, parts[-1]))
+            if found:
+                return found
+
+        for _, entry, itera in walk_entries(self.passwords,
+                self.passwords.get_iter_first()):
+            if entry.name == name:
+                return [itera]
+        return []
+
+    def _iter_named(self, parents, name):
+        """ Yields the children of the given folders having the given
+        name.
+        :arg parents, a list of iterators of folders, None being the root
+        of the EntryStore.
+        :arg name, the name of the children to return.
+        """
+        for parent in parents:
+            itera = self.passwords.iter_children(parent)
+            while itera is not None:
+                if self.passwords.get_value(itera, 2).name == name:
+                    yield itera
+                itera = self.passwords.iter_next(itera)
 
     def get_password(self):
-        """ Retrieve the root element of the tree and start browsing the
-        tree for the searched password.
+        """ Search the tree for the password requested and print it.
+        Returns a boolean whether the password was found or not.
         """
         LOG.debug('Browse passwords to find the one requested.')
-        itera = self.passwords.get_iter_first()
-        self.__browse_entry(itera)
+        matches = self.find_password(self.password_name)
+        for itera in matches:
+            self._print_password(self.passwords.get_value(itera, 2))
+        return bool(matches)
+
+    def resolve_batch(self, queries):
+        """ Search the EntryStore for all the given passwords in a single
+        pass and returns a dictionnary of the list of (path, entry) found
+        for each of them.
+        As for find_password, a name matches its first occurrence in the
+        tree while a path matches all the entries at this path, or the
+        first entry having exactly this name if there are none.
+        :arg queries, a list of names or paths (ie: Folder/Sub/Name).
+        """
+        names = {}
+        paths = {}
+        for query in queries:
+            if '/' in query:
+                path = '/' + '/'.join(part for part in query.split('/')
+                    if part)
+                paths.setdefault(path, set()).add(query)
+            names[query] = [query]
+        results = dict((query, []) for query in queries)
+        named = {}
+
+        folders = ['']
+        for depth, entry, _ in walk_entries(self.passwords,
+                self.passwords.get_iter_first()):
+            if not names and not paths:
+                break
+            del folders[depth + 1:]
+            path = '%s/%s' % (folders[depth], entry.name)
+            if entry.typename == 'Folder':
+                folders.append(path)
+            for query in paths.get(path, ()):
+                results[query].append((path, entry))
+            for query in names.pop(entry.name, []):
+                named[query] = (path, entry)
+        for query, found in named.items():
+            if not results[query]:
+                results[query].append(found)
+        return results
+
+    def read_batch(self, filename):
+        """ Returns the names or paths of passwords listed in the given
+        file, one per line.
+        :arg filename, the file to read, - for the standard input.
+        """
+        if filename == '-':
+            queries = sys.stdin.read().splitlines()
+        else:
+            stream = open(filename)
+            queries = stream.read().splitlines()
+            stream.close()
+        return [query.strip() for query in queries if query.strip()]
+
+    def run_batch(self, queries):
+        """ Retrieve the given passwords and print one JSON record per
+        query.
+        :arg queries, a list of names or paths (ie: Folder/Sub/Name).
+        """
+        results = self.resolve_batch(queries)
+
+        def records():
+            for query in queries:
+                entries = []
+                for path, entry in results[query]:
+                    fields = {}
+                    for field in entry.fields:
+                        if field.value and (self.show
+                                or not is_secret(field)):
+                            fields[field.name] = field.value
+                    entries.append({'path': path, 'name': entry.name,
+                        'type': entry.typename, 'fields': fields})
+                yield json.dumps({'query': query, 'found': bool(entries),
+                    'entries': entries})
+        write_lines(records())
+
+    def _iter_records(self, fields=None):
+        """ Yields for each entry of the EntryStore, in the order of the
+        tree, its path, its type, its description and a dictionnary of its
+        fields. The secret fields are only included if asked for.
+        :kwarg fields, the list of the names of the fields to return,
+        defaults to all.
+        """
+        folders = ['']
+        for depth, entry, _ in walk_entries(self.passwords,
+                self.passwords.get_iter_first()):
+            del folders[depth + 1:]
+            path = '%s/%s' % (folders[depth], entry.name)
+            if entry.typename == 'Folder':
+                folders.append(path)
+            values = {}
+            for field in entry.fields:
+                if not field.value:
+                    continue
+                if is_secret(field) and not self.show:
+                    continue
+                if fields is None or field.name in fields:
+                    values[field.name] = field.value
+            yield path, entry.typename, entry.description or '', values
+
+    def export(self, fmt, fields=None):
+        """ Prints every entry of the EntryStore as they are browsed,
+        either as JSON lines or as CSV.
+        :arg fmt, the format of the export, json or csv.
+        :kwarg fields, the list of the names of the fields to export,
+        defaults to all.
+        """
+        if fmt == 'json':
+            write_lines(json.dumps({'path': path, 'type': typename,
+                'description': description, 'fields': values})
+                for path, typename, description, values
+                in self._iter_records(fields))
+            return
+
+        if fields is None:
+            # Browse the tree once to know the columns rather than keeping
+            # all the entries in memory.
+            fields = set()
+            for _, _, _, values in self._iter_records():
+                fields.update(values)
+            fields = sorted(fields)
+        elif not self.show and 'Password' in fields:
+            fields = [field for field in fields if field != 'Password']
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['Path', 'Type', 'Description'] + fields)
+        for path, typename, description, values in \
+                self._iter_records(fields):
+            row = [path, typename, description] + [values.get(field, '')
+                for field in fields]
+            writer.writerow([value.encode('utf-8')
+                if isinstance(value, unicode) else value for value in row])
+        sys.stdout.flush()
+
+    def get_password_from_agent(self):
+        """ Ask the running agent for the password requested and print it.
+        Returns a boolean whether the password was found or not, or None
+        if no agent could answer for this database.
+        """
+        LOG.debug('Ask the agent for the password requested.')
+        answer = agent_request({'databases': [os.path.abspath(dbfile)
+            for dbfile in self.dbfiles], 'name': self.password_name})
+        if answer is None or 'error' in answer:
+            if answer:
+                LOG.info('Agent: %s', answer['error'])
+            return None
+        for entry in answer['entries']:
+            self._print_password(AgentEntry(entry['name'], entry['fields']))
+        return bool(answer['entries'])
 
     def read_revelation_file(self):
         """ Decrypt the content of the revelation database.
         """
         LOG.debug('Read the content of the database.')
-        self.handler = detect_handler(self.dbdata)
-        dafi = DataFile(self.handler)
-        password = getpass.getpass()
-        content = dafi.load(self.dbfile, password=password)
+        with self.timer.phase('detect_handler'):
+            self.handler = detect_database_handler(self.dbdata)
+        with self.timer.phase('password prompt'):
+            password = getpass.getpass()
+        self.password = password
+        # The data already read is given to the handler rather than
+        # having DataFile.load read the file a second time.
+        # Key derivation, decryption, decompression and parsing all
+        # happen within the handler, they can not be timed separately.
+        cache = None
+        if self.cache:
+            cache = TreeCache(self.dbfile)
+            with self.timer.phase('load from cache'):
+                try:
+                    content = cache.load(self.dbdata, password)
+                except Exception, exc:
+                    LOG.warning('The cache could not be read: %s', exc)
+                    content = None
+            if content is not None:
+                return content
+        with self.timer.phase('load (decrypt and parse)'):
+            handler = self.handler()
+            handler.check(self.dbdata)
+            content = handler.import_data(self.dbdata, password)
+        if cache:
+            with self.timer.phase('write cache'):
+                try:
+                    cache.save(content, self.dbdata, password)
+                except Exception, exc:
+                    LOG.warning('The cache could not be written: %s', exc)
         return content
 
-    def show_tree(self, folder_only=False, iterative=True):
+    def read_revelation_files(self, dbfiles):
+        """ Decrypt several revelation databases in parallel and returns
+        an EntryStore with each of them in a top-level folder named after
+        its file.
+        The password is asked once and only asked again for the databases
+        it does not open.
+        :arg dbfiles, the list of the databases to open.
+        """
+        LOG.debug('Read the content of the databases.')
+        import multiprocessing
+        from revelation import data, datahandler, entry
+        with self.timer.phase('password prompt'):
+            password = getpass.getpass()
+        self.password = password
+        passwords = dict((dbfile, password) for dbfile in dbfiles)
+        contents = {}
+        pool = multiprocessing.Pool(min(len(dbfiles),
+            multiprocessing.cpu_count()))
+        try:
+            while True:
+                # A database mounted twice is only decrypted once
+                todo = [dbfile for dbfile in sorted(set(dbfiles))
+                    if dbfile not in contents]
+                if not todo:
+                    break
+                with self.timer.phase('load (%s database(s))' % len(todo)):
+                    results = pool.map(decrypt_worker,
+                        [(dbfile, passwords[dbfile]) for dbfile in todo])
+                for dbfile, content, error in results:
+                    if error == 'io':
+                        raise IOError('Could not read %s' % dbfile)
+                    elif error:
+                        LOG.debug('%s: %s', dbfile, error)
+                        if passwords[dbfile] != password:
+                            raise ValueError('Wrong password for %s'
+                                % dbfile)
+                        passwords[dbfile] = getpass.getpass(
+                            'Password for %s: ' % dbfile)
+                    else:
+                        contents[dbfile] = content
+        finally:
+            pool.terminate()
+
+        with self.timer.phase('mount databases'):
+            # The combined store is saved encrypted, in the default
+            # format of revelation, never as the XML it is read from
+            self.handler = getattr(datahandler, 'Revelation2', None) \
+                or datahandler.Revelation
+            xml = datahandler.RevelationXML()
+            store = data.EntryStore()
+            names = set()
+            for dbfile in dbfiles:
+                name = os.path.splitext(os.path.basename(dbfile))[0]
+                cnt = 1
+                while name in names:
+                    cnt += 1
+                    name = '%s (%s)' % (
+                        os.path.splitext(os.path.basename(dbfile))[0], cnt)
+                names.add(name)
+                folder = entry.FolderEntry()
+                folder.name = name
+                parent = store.add_entry(folder)
+                content = xml.import_data(contents[dbfile])
+                itera = content.get_iter_first()
+                while itera is not None:
+                    store.import_entry(content, itera, parent)
+                    itera = content.iter_next(itera)
+        return store
+
+    def diff(self, dbfile, merge=None):
+        """ Prints the differences between the opened database and another
+        one, optionally saving the merge of both.
+        Returns False if the merge could not be written.
+        When merging, the entries added in the other database are added
+        and the ones changed are replaced, the ones it does not have are
+        kept.
+        :arg dbfile, the other database.
+        :kwarg merge, the file into which the merge is saved.
+        """
+        try:
+            other = load_database(dbfile, self.password)[0]
+        except IOError:
+            raise
+        except Exception, exc:
+            # Try the password of the opened database first
+            LOG.debug(exc)
+            other = load_database(dbfile,
+                getpass.getpass('Password for %s: ' % dbfile))[0]
+
+        hashes = hash_entries(self.passwords)[0]
+        other_hashes, other_order = hash_entries(other)
+        added = [path for path in other_order if path not in hashes]
+        changed = [path for path in other_order if path in hashes
+            and hashes[path][0] != other_hashes[path][0]]
+        removed = sorted(path for path in hashes
+            if path not in other_hashes)
+        write_lines(itertools.chain(
+            ('+ %s' % path for path in added),
+            ('- %s' % path for path in removed),
+            ('~ %s' % path for path in changed)))
+        print '%s added, %s removed, %s changed' % (len(added),
+            len(removed), len(changed))
+
+        if merge:
+            try:
+                self._merge(other, hashes, other_hashes, changed, added)
+                write_atomic(merge, self.handler().export_data(
+                    self.passwords, self.password))
+            except Exception, exc:
+                LOG.debug(exc)
+                print 'The merge could not be written in %s: %s' % (merge,
+                    getattr(exc, 'strerror', None) or exc)
+                return False
+            print 'Merge saved in %s' % merge
+        return True
+
+    def _merge(self, other, hashes, other_hashes, changed, added):
+        """ Replace the changed entries and add the new entries of another
+        database to the opened one.
+        An entry which became or stopped being a folder is removed, along
+        with its children, and the entry of the other database is added
+        in its place.
+        :arg other, the EntryStore of the other database.
+        :arg hashes, the hashes of the entries of the opened database.
+        :arg other_hashes, the hashes of the entries of the other one.
+        :arg changed, the paths of the entries changed.
+        :arg added, the paths of the entries added, in the order of the
+        tree.
+        """
+        iters = dict((path, hashes[path][1]) for path in hashes)
+        iters[''] = None
+        for path in changed:
+            itera = iters[path]
+            entry = other.get_entry(other_hashes[path][1])
+            if (entry.typename == 'Folder') == (
+                    self.passwords.get_value(itera, 2).typename == 'Folder'):
+                self.passwords.update_entry(itera, entry)
+                continue
+            sibling = self.passwords.iter_next(itera)
+            self.passwords.remove_entry(itera)
+            iters[path] = self.passwords.add_entry(entry,
+                iters[hashes[path][2]], sibling)
+        for path in added:
+            iters[path] = self.passwords.add_entry(
+                other.get_entry(other_hashes[path][1]),
+                iters[other_hashes[path][2]])
+
+    def audit(self, show=False, max_age=365):
+        """ Browse all the passwords once and reports the ones used by
+        several entries, the weak ones and the old ones.
+        The passwords are compared using a keyed hash, with a key drawn
+        for each audit, rather than kept in memory.
+        :kwarg show, a boolean specifying whether to print the passwords.
+        :kwarg max_age, the number of days after which a password is
+        reported as old.
+        """
+        key = os.urandom(32)
+        reused = {}
+        weak = []
+        old = []
+        count = 0
+        limit = time.time() - max_age * 86400
+        folders = ['']
+        for depth, entry, _ in walk_entries(self.passwords,
+                self.passwords.get_iter_first()):
+            del folders[depth + 1:]
+            path = '%s/%s' % (folders[depth], entry.name)
+            if entry.typename == 'Folder':
+                folders.append(path)
+                continue
+            for field in entry.fields:
+                if not is_secret(field) or not field.value:
+                    continue
+                count += 1
+                password = field.value
+                if isinstance(password, unicode):
+                    password = password.encode('utf-8')
+                digest = hmac.new(key, password, hashlib.sha256).digest()
+                reused.setdefault(digest, []).append((path, password
+                    if show else None))
+                reasons = password_weaknesses(password)
+                if reasons:
+                    weak.append((path, reasons, password if show else None))
+                updated = getattr(entry, 'updated', None)
+                if updated and updated < limit:
+                    old.append((path, int((time.time() - updated) / 86400)))
+        reused = [paths for paths in reused.values() if len(paths) > 1]
+        reused.sort(key=lambda paths: paths[0][0])
+
+        def lines():
+            if reused:
+                yield 'Passwords used more than once:'
+                for paths in reused:
+                    yield '  %s entries%s' % (len(paths),
+                        ' (%s)' % paths[0][1] if show else '')
+                    for path, _ in paths:
+                        yield '    %s' % path
+            if weak:
+                yield 'Weak passwords:'
+                for path, reasons, password in weak:
+                    yield '  %s: %s%s' % (path, ', '.join(reasons),
+                        ' (%s)' % password if show else '')
+            if old:
+                yield 'Passwords older than %s days:' % max_age
+                for path, age in old:
+                    yield '  %s: %s days' % (path, age)
+            yield '%s passwords, %s reused, %s weak, %s old' % (count,
+                sum(len(paths) for paths in reused), len(weak), len(old))
+        write_lines(lines())
+
+    def show_tree(self, folder_only=False, iterative=True, path=None,
+        depth=None, limit=None):
         """ Prints the revelation database as an ascii-tree into the
         terminal.
+        Returns False if the given path is not a folder of the database.
         :kwarg folder_only, a boolean specifying whether the output
         should contain only the folder or not.
+        :kwarg path, the path of the folder to print, defaults to the
+        whole database.
+        :kwarg depth, the number of levels of the tree to print, defaults
+        to all.
+        :kwarg limit, the maximum number of entries to print.
         """
         LOG.debug('Show the ascii-tree of the database.')
         itera = self.passwords.get_iter_first()
-        print "Database:"
+        if path and path.strip('/'):
+            folders = [match for match in self.find_password('/' + path)
+                if self.passwords.get_value(match, 2).typename == 'Folder']
+            if not folders:
+                return False
+            itera = self.passwords.iter_children(folders[0])
+            print "%s:" % path
+        else:
+            print "Database:"
         self._browse_entry(itera, lvl=1, folder_only=folder_only,
-            iterative=iterative)
+            iterative=iterative, depth=depth, limit=limit)
+        return True
 
 
 class RevelationInteractive(cmd.Cmd, RevelationCli):
 
-    def __init__(self, passwords, filename, handler):
+    def __init__(self, passwords, filename, handler, autosave=None,
+            password=None, clipboard='auto', clipboard_timeout=30):
         cmd.Cmd.__init__(self)
         self.passwords = passwords
         self.filename = filename
         self.handler = handler
-        self.data = data.EntryStore()
+        self.autosave = autosave
+        # Kept to save the database automatically and to reload it when
+        # it changes on the disk.
+        self.password = password
+        self.filestat = self._file_stat()
+        self.reload_warned = False
+        self.clipboard_name = clipboard
+        self.clipboard_timeout = clipboard_timeout
+        self.clipboard = None
+        self.clipboard_timer = None
+        self.saves = Queue.Queue()
+        self.save_thread = None
+        self.autosave_timer = None
+        # The copy of the database waiting for the autosave timer
+        self.autosave_pending = None
         self.intro = 'See `help` for a list of the command available.'
         self.path = "/"
         self.modified = False
         self.itera = self.passwords.get_iter_first()
         self.root_itera = self.passwords.get_iter_first()
-        self.data.import_entry(self.passwords, self.root_itera)
-        self.entrysearch = data.EntrySearch(self.passwords)
-        if not TKIMPORT:
-            warn('The copy command from the interactive shell will not be available. '\
-        'Install the Tkinter library to have it.')
+        self.index = EntryIndex(self.passwords)
+        self.search = None
+        self.command_times = {}
+        self._command_start = None
+
+    def precmd(self, line):
+        self._report_saves()
+        self._check_reload()
+        self._command_start = time.time()
+        return line
+
+    def _clear_clipboard(self):
+        """ Empty the clipboard and cancel its pending clearing. """
+        if self.clipboard_timer:
+            self.clipboard_timer.cancel()
+            self.clipboard_timer = None
+        try:
+            self.clipboard.clear()
+        except Exception, exc:
+            LOG.debug('The clipboard could not be cleared: %s', exc)
+
+    def _file_stat(self):
+        """ Returns the size, modification time and inode of the database
+        file, used to know when it changed.
+        """
+        if not self.filename:
+            return None
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return None
+        return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+    def _check_reload(self):
+        """ Reload the database if its file changed since it was loaded. """
+        if not self.filename or (self.save_thread is not None
+                and self.save_thread.is_alive()):
+            return
+        stat = self._file_stat()
+        if stat is None or stat == self.filestat:
+            return
+        # Changes waiting for the autosave are changes made here too
+        if self.modified or self.autosave_pending is not None:
+            if not self.reload_warned:
+                print 'The database changed on the disk but it has been ' \
+                    'modified here, it will not be reloaded.'
+                self.reload_warned = True
+            return
+        if self.autosave_timer is not None \
+                and self.autosave_timer.is_alive():
+            # The autosave is being written
+            return
+        print 'The database changed on the disk, reloading it.'
+        try:
+            self.reload()
+        except Exception, exc:
+            LOG.debug(exc)
+            print 'The database could not be reloaded, it will be tried ' \
+                'again: %s' % exc
+        else:
+            self.filestat = stat
+
+    def reload(self):
+        """ Read the database from the disk again, keeping the current
+        directory if it still exists and updating the indexes.
+        """
+        if self.password is None:
+            self.password = getpass.getpass()
+        passwords, handler = load_database(self.filename, self.password)
+        if isinstance(self.passwords, EntrySnapshot):
+            passwords = EntrySnapshot(passwords)
+        self.handler = handler
+        self.passwords = passwords
+        self.index.rebind(passwords)
+        if self.search is not None:
+            self.search.rebind(passwords)
+
+        path = self.path
+        while path != '/' and self.index.get_children(path) is None:
+            path = posixpath.dirname(path)
+        self.root_itera = self.passwords.get_iter_first()
+        self.itera = self.root_itera
+        self.path = '/'
+        if path != '/':
+            self.do_cd(path)
+
+    def postcmd(self, stop, line):
+        if self._command_start is not None:
+            command = line.split(' ', 1)[0] if line.strip() else 'emptyline'
+            count, total = self.command_times.get(command, (0, 0))
+            self.command_times[command] = (count + 1,
+                total + time.time() - self._command_start)
+            self._command_start = None
+        if self.modified and self.autosave and self.filename \
+                and self.password is not None:
+            self._schedule_autosave()
+        return stop
+
+    def _copy_store(self):
+        """ Returns a copy of the EntryStore, which can be saved while the
+        shell keeps running.
+        """
+        from revelation import data
+        store = data.EntryStore()
+        store.import_entry(self.passwords, None)
+        return store
+
+    def _save(self, store, filename, password):
+        """ Encrypt the given EntryStore and write it atomically into the
+        given file, the result is queued to be reported in the shell.
+        :arg store, the EntryStore to save.
+        :arg filename, the file to write.
+        :arg password, the password used to encrypt the database.
+        """
+        try:
+            write_atomic(filename,
+                self.handler().export_data(store, password))
+        except Exception, exc:
+            LOG.debug(exc)
+            self.saves.put((filename, exc))
+        else:
+            self.saves.put((filename, None))
+
+    def _start_save(self, filename, password):
+        """ Save a copy of the current EntryStore in a background thread.
+        :arg filename, the file to write.
+        :arg password, the password used to encrypt the database.
+        """
+        self._cancel_autosave()
+        if filename == self.filename:
+            # Superseded by this save
+            self.autosave_pending = None
+        else:
+            self._autosave()
+        self._wait_save()
+        self.save_thread = threading.Thread(target=self._save,
+            args=(self._copy_store(), filename, password))
+        self.save_thread.start()
+        self.modified = False
+
+    def _schedule_autosave(self):
+        """ (Re)start the timer saving the database once it has been left
+        idle for the autosave delay. The copy saved is taken now, as the
+        EntryStore may only be accessed from the main thread.
+        """
+        self._cancel_autosave()
+        self._wait_save()
+        self.autosave_pending = (self._copy_store(), self.filename,
+            self.password)
+        self.autosave_timer = threading.Timer(self.autosave, self._autosave)
+        self.autosave_timer.daemon = True
+        self.autosave_timer.start()
+        self.modified = False
+
+    def _autosave(self):
+        """ Save the copy of the database waiting for the autosave, if it
+        was not saved already.
+        """
+        pending, self.autosave_pending = self.autosave_pending, None
+        if pending is not None:
+            self._save(*pending)
+
+    def _cancel_autosave(self):
+        """ Stop the autosave timer, waiting for it to finish if it
+        already fired. The copy it would have saved is left pending.
+        """
+        if self.autosave_timer:
+            self.autosave_timer.cancel()
+            self.autosave_timer.join()
+            self.autosave_timer = None
+
+    def _wait_save(self):
+        """ Wait for the save running in the background, if any, to
+        finish.
+        """
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
+        self._report_saves()
+
+    def _report_saves(self):
+        """ Prints the result of the saves finished in the background. """
+        while True:
+            try:
+                filename, exc = self.saves.get_nowait()
+            except Queue.Empty:
+                break
+            if exc is None:
+                if filename == self.filename:
+                    self.filestat = self._file_stat()
+                print "Saved %s" % filename
+            else:
+                self.modified = True
+                print "Saving %s failed: %s" % (filename, exc)
+
+    def _complete_path(self, text, line, end_index, passwords=True):
+        """ Returns the completions of the path given as argument to a
+        command, relatively to the text being completed.
+        :arg text, the text being completed.
+        :arg line, the command line.
+        :arg end_index, the end of the text being completed in the line.
+        :kwarg passwords, a boolean specifying whether the passwords can
+        be completed, otherwise only the folders are.
+        """
+        arg = line[:end_index].partition(' ')[2].lstrip()
+        dirname, sep, base = arg.rpartition('/')
+        folder = self.index.resolve(self.path, (dirname + sep) or '.')
+        # What readline replaces may start before or after the folder
+        # depending on the delimiters it uses.
+        offset = len(arg) - len(text)
+        return [(dirname + sep + name)[offset:] for name in
+            self.index.complete(folder, base, passwords=passwords)]
 
     def complete_cat(self, text, line, start_index, end_index):
-        options = []
-        itera = self.itera
-        while self.passwords.iter_next(itera):
-            entry = self.passwords.get_value(itera, 2)
-            if entry.typename != 'Folder':
-                options.append(entry.name)
-            itera = self.passwords.iter_next(itera)
-        entry = self.passwords.get_value(itera, 2)
-        if entry.typename != 'Folder':
-                options.append(entry.name)
-        return options
+        return self._complete_path(text, line, end_index)
 
     def complete_cd(self, text, line, start_index, end_index):
-        options = []
-        itera = self.itera
-        while self.passwords.iter_next(itera):
-            entry = self.passwords.get_value(itera, 2)
-            if entry.typename == 'Folder':
-                options.append(entry.name)
-            itera = self.passwords.iter_next(itera)
-        entry = self.passwords.get_value(itera, 2)
-        if entry.typename == 'Folder':
-                options.append(entry.name)
-        return options
+        return self._complete_path(text, line, end_index, passwords=False)
 
     def complete_cmd(self, text, line, start_index, end_index):
-        commands = ['cat', 'cd', 'exit', 'find', 'ls', 'pwd',
-            'quit', 'save', 'view']
+        commands = ['audit', 'cat', 'cd', 'exit', 'find', 'ls', 'pwd',
+            'quit', 'save', 'stats', 'view']
         return commands
 
+    def complete_copy(self, text, line, start_index, end_index):
+        return self._complete_path(text, line, end_index)
+
+    def complete_ls(self, text, line, start_index, end_index):
+        return self._complete_path(text, line, end_index, passwords=False)
+
     def complete_view(self, text, line, start_index, end_index):
-        options = []
-        itera = self.itera
-        while self.passwords.iter_next(itera):
+        return self._complete_path(text, line, end_index)
+
+    def _get_entry(self, params):
+        """ Returns the iterator of the entry of the given name in the
+        current directory, or at the given path, None if there is no such
+        entry.
+        :arg params, the name or the path of the entry.
+        """
+        itera = self.index.get(self.index.resolve(self.path, params))
+        if itera is not None:
             entry = self.passwords.get_value(itera, 2)
-            if entry.typename != 'Folder':
-                options.append(entry.name)
-            itera = self.passwords.iter_next(itera)
-        entry = self.passwords.get_value(itera, 2)
-        if entry.typename != 'Folder':
-                options.append(entry.name)
-        return options
+            LOG.debug('Entry (%s) : %s', entry.typename, entry.name)
+        return itera
+
+    def do_audit(self, params):
+        """ Report the passwords used more than once, the weak ones and
+        the old ones, the passwords are only displayed with --show.
+        """
+        self.audit(show=params.strip() == '--show')
 
     def do_cat(self, params):
         """ Display the information relative to a given password. """
@@ -339,39 +2229,41 @@ class RevelationInteractive(cmd.Cmd, RevelationCli):
 
     def do_copy(self, params):
         """ Copy the password of the given account to the clipboard. """
-        if not TKIMPORT:
-            print 'Command not available.'
-            return
         if not params:
             print 'No password specified'
         else:
-            found = False
-            itera = self.itera
-            while self.passwords.iter_next(itera):
-                entry = self.passwords.get_value(itera, 2)
-                LOG.debug('- Entry (%s) : %s', entry.typename, entry.name)
-                if entry.name == params:
-                    found = True
-                    break
-                itera = self.passwords.iter_next(itera)
-            entry = self.passwords.get_value(itera, 2)
-            LOG.debug('* Entry (%s) : %s', entry.typename, entry.name)
-            if entry.name == params:
-                    found = True
-
-            if found:
+            itera = self._get_entry(params)
+            if itera is not None:
+                if self.clipboard is None:
+                    try:
+                        self.clipboard = get_clipboard(self.clipboard_name)
+                    except Exception, exc:
+                        LOG.debug(exc)
+                        print 'Command not available. Install xclip, ' \
+                            'xsel or the Tkinter library to have it.'
+                        return
+                if self.clipboard_timeout and not self.clipboard.threadsafe:
+                    print 'The Tk clipboard can not be cleared after a ' \
+                        'timeout. Install xclip or xsel, or use ' \
+                        '--clipboard-timeout 0 to keep the password copied.'
+                    return
                 print params
                 entry = self.passwords.get_value(itera, 2)
-                LOG.debug('Entry (%s) : %s', entry.typename, entry.name)
                 print "  Name:%s%s" % (" "*abs(len('Name') -15), entry.name)
-                ## FIXME: for some reason doesn't work so well...
-                r = Tk()
-                r.withdraw()
-                r.clipboard_clear()
+                password = ''
                 for fields in entry.fields:
                     if fields.value.strip():
                         if fields.name == 'Password':
-                            r.clipboard_append(fields.value)
+                            password += fields.value
+                if self.clipboard_timer:
+                    self.clipboard_timer.cancel()
+                    self.clipboard_timer = None
+                self.clipboard.copy(password)
+                if self.clipboard_timeout:
+                    self.clipboard_timer = threading.Timer(
+                        self.clipboard_timeout, self.clipboard.clear)
+                    self.clipboard_timer.daemon = True
+                    self.clipboard_timer.start()
             else:
                 print 'No password of the name "%s" were found in ' \
                 'this folder.' % params
@@ -383,36 +2275,18 @@ class RevelationInteractive(cmd.Cmd, RevelationCli):
             self.path = '/'
             return
 
-        found = False
-        itera = self.itera
-        if params == '..':
-            parent = self.passwords.iter_parent(self.itera)
-            if parent is not None:
-                grandparent = self.passwords.iter_parent(parent)
-                if grandparent is not None:
-                    self.itera = self.passwords.iter_children(grandparent)
-                    self.path = os.path.dirname(self.path)
-                else:
-                    self.itera = self.root_itera
-                    self.path = '/'
-                found = True
-        else:
-            while self.passwords.iter_next(itera):
-                entry = self.passwords.get_value(itera, 2)
-                LOG.debug('- Entry (%s) : %s', entry.typename, entry.name)
-                if entry.name == params and entry.typename == 'Folder':
-                    self.itera = self.passwords.iter_children(itera)
-                    found = True
-                    break
-                itera = self.passwords.iter_next(itera)
-            entry = self.passwords.get_value(itera, 2)
-            LOG.debug('* Entry (%s) : %s', entry.typename, entry.name)
-            if entry.name == params and entry.typename == 'Folder':
-                self.itera = self.passwords.iter_children(itera)
-                self.path = '%s/%s' % (self.path, params)
-                found = True
+        path = self.index.resolve(self.path, params)
+        if path == '/':
+            self.itera = self.root_itera
+            self.path = '/'
+            return
 
-        if not found:
+        itera = self.index.get(path)
+        if itera is not None and \
+                self.passwords.get_value(itera, 2).typename == 'Folder':
+            self.itera = self.passwords.iter_children(itera)
+            self.path = path
+        else:
             print 'No folder of the name "%s" were found in this folder.' % params
 
     def do_exit(self, params):
@@ -426,34 +2300,30 @@ class RevelationInteractive(cmd.Cmd, RevelationCli):
 
     def do_ls(self, params):
         """ List directory and password available in the current
-        directory.
+        directory, or in the given one.
+        :arg -d DEPTH, the number of levels to list, defaults to 1.
         """
+        depth = 1
+        if params.startswith('-d'):
+            parts = params.split(None, 2)
+            try:
+                depth = positive_int(parts[1])
+            except (IndexError, argparse.ArgumentTypeError):
+                print 'Usage: ls [-d DEPTH] [FOLDER], DEPTH being 1 or more'
+                return
+            params = parts[2] if len(parts) > 2 else ''
         if not params:
-            self._browse_entry(self.itera, lvl=1, folder_only=False,
-            iterative=False)
+            if self.itera is not None:
+                self._browse_entry(self.itera, lvl=1, folder_only=False,
+                    depth=depth)
         else:
-            found = False
-            itera = self.itera
-            while self.passwords.iter_next(itera):
-                entry = self.passwords.get_value(itera, 2)
-                LOG.debug('- Entry (%s) : %s', entry.typename, entry.name)
-                if entry.name == params:
-                    found = True
-                    break
-                itera = self.passwords.iter_next(itera)
-            entry = self.passwords.get_value(itera, 2)
-            LOG.debug('* Entry (%s) : %s', entry.typename, entry.name)
-            if entry.name == params:
-                    found = True
-
-            if found:
+            itera = self._get_entry(params)
+            if itera is not None:
                 print params
-                entry = self.passwords.get_value(itera, 2)
-                LOG.debug('Entry (%s) : %s', entry.typename, entry.name)
                 if self.passwords.iter_has_child(itera):
                     children = self.passwords.iter_children(itera)
                     self._browse_entry(children, lvl=1,
-                            folder_only=False, iterative=False)
+                            folder_only=False, depth=depth)
             else:
                 print 'No folder %s found' % params
 
@@ -466,27 +2336,29 @@ class RevelationInteractive(cmd.Cmd, RevelationCli):
         :arg filename to which the database will be saved, if not
         specified it will save the current file or will take it the
         default from the configuration file."""
-        if not params and not self.filename:
+        if isinstance(self.passwords, EntrySnapshot):
+            print 'The database was opened as a read-only snapshot.'
+        elif not params and not self.filename:
             print 'Please specify a filename to which save the database.'
         else:
             password = getpass.getpass()
             if self.filename and not params:
-                io = DataFile(self.handler)
-                io.save(self.passwords, self.filename, password=password)
-                print "Saved"
-                self.modified = False
+                self._start_save(self.filename, password)
+                print "Saving in the background"
             elif params:
                 filename = os.path.expanduser(params)
                 if filename == params:
                     filename = os.path.join(os.getcwd(), filename)
-                io = DataFile(self.handler)
                 print filename
-                io.save(self.passwords, filename, password=password)
-                print "Saved"
-                self.modified = False
+                self._start_save(filename, password)
+                print "Saving in the background"
 
     def do_quit(self, params):
         """ Quit the program. """
+        # Run the pending autosave now, rather than losing the changes
+        self._cancel_autosave()
+        self._autosave()
+        self._wait_save()
         if self.modified:
             print 'The database has been modified.'
             usr_inp = raw_input('Do you want to quit (q), save (s), cancel (c)? ')
@@ -494,31 +2366,43 @@ class RevelationInteractive(cmd.Cmd, RevelationCli):
                 return
             elif usr_inp.lower() == 's':
                 self.do_save(None)
+        self._wait_save()
+        if self.clipboard_timer:
+            self._clear_clipboard()
         sys.exit(1)
 
+    def do_stats(self, params):
+        """ Display statistics on the database and the time spent in each
+        command.
+        """
+        counts = {}
+        depth = 0
+        for lvl, entry, _ in walk_entries(self.passwords,
+                self.passwords.get_iter_first()):
+            counts[entry.typename] = counts.get(entry.typename, 0) + 1
+            depth = max(depth, lvl + 1)
+        print 'Entries:%s%s' % (' ' * 12, sum(counts.values()))
+        print 'Folders:%s%s' % (' ' * 12, counts.get('Folder', 0))
+        print 'Depth:%s%s' % (' ' * 14, depth)
+        for typename, count in sorted(counts.items()):
+            if typename != 'Folder':
+                print '  %s:%s%s' % (typename,
+                    ' ' * abs(len(typename) - 17), count)
+        if self.command_times:
+            print '%-20s %6s %10s' % ('Command', 'Calls', 'Time (s)')
+            for command, (count, total) in sorted(
+                    self.command_times.items()):
+                print '%-20s %6d %10.4f' % (command, count, total)
+
     def do_view(self, params):
         """ Display the information relative to a given password. """
         if not params:
             print 'No password specified'
         else:
-            found = False
-            itera = self.itera
-            while self.passwords.iter_next(itera):
-                entry = self.passwords.get_value(itera, 2)
-                LOG.debug('- Entry (%s) : %s', entry.typename, entry.name)
-                if entry.name == params:
-                    found = True
-                    break
-                itera = self.passwords.iter_next(itera)
-            entry = self.passwords.get_value(itera, 2)
-            LOG.debug('* Entry (%s) : %s', entry.typename, entry.name)
-            if entry.name == params:
-                    found = True
-
-            if found:
+            itera = self._get_entry(params)
+            if itera is not None:
                 print params
                 entry = self.passwords.get_value(itera, 2)
-                LOG.debug('Entry (%s) : %s', entry.typename, entry.name)
                 print "  Name:%s%s" % (" "*abs(len('Name') -15), entry.name)
                 if entry.description:
                     print "  Description:%s%s" % (" "*abs(len('Description') -15),
@@ -534,22 +2418,11 @@ class RevelationInteractive(cmd.Cmd, RevelationCli):
                 'this folder.' % params
 
     def do_find(self, params):
-        """Search a specific password and display a list of matching paths."""
-        def check_entry(model, path, iter, user_data):
-            if self.entrysearch.match(iter, user_data['kw']):
-                user_data['matches'].append(iter)
-            return False
-
-        user_data = {'matches': [], 'kw': params}
-        self.passwords.foreach(check_entry, user_data)
-
-        for entry in user_data['matches']:
-            path = self.passwords.get_entry(entry).name
-            parent = self.passwords.iter_parent(entry)
-            while parent:
-                path = self.passwords.get_entry(parent).name + '/' + path
-                parent = self.passwords.iter_parent(parent)
-            print '/' + path
+        """Search the passwords having words starting with each of the
+        given terms and display a list of matching paths."""
+        if self.search is None:
+            self.search = SearchIndex(self.passwords)
+        write_lines(path for path, _ in self.search.search(params))
 
 if __name__ == "__main__":
     RevelationCli().main()
@@ -0,0 +1,185 @@
+#-*- coding: utf-8 -*-
+
+"""
+Helpers shared by the tests of revelationcli.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    from revelation import data, datahandler, entry
+except ImportError:
+    data = datahandler = entry = None
+
+HAS_REVELATION = data is not None
+# Names of the fields of the stub entries holding secrets
+SECRET_FIELDS = ('Password', 'PIN')
+
+
+class StubField(object):
+    """ A field of a stub entry, with the attributes of the fields of
+    revelation.
+    """
+
+    def __init__(self, name, value):
+        self.id = 'generic-%s' % name.lower()
+        self.name = name
+        self.value = value
+        self.datatype = 'password' if name in SECRET_FIELDS else 'string'
+
+    def __str__(self):
+        return self.value
+
+
+class StubEntry(object):
+    """ An entry of a stub store, with the attributes of the entries of
+    revelation.
+    """
+
+    def __init__(self, name, typename, fields=None, description='',
+            updated=0):
+        self.name = name
+        self.typename = typename
+        self.description = description
+        self.updated = updated
+        self.fields = [StubField(fname, value) for fname, value in
+            sorted((fields or {}).items())]
+
+
+class StubStore(object):
+    """ A tree of entries providing the methods of the EntryStore used to
+    browse it, the iterators being the lists of the siblings along with
+    the index of the element.
+    """
+
+    def __init__(self, tree):
+        """ Default constructor.
+        :arg tree, the tree of entries as given to make_stub_store.
+        """
+        self.root = self._build(tree)
+
+    def _build(self, tree):
+        nodes = []
+        for name, content in tree:
+            if isinstance(content, list):
+                nodes.append((StubEntry(name, 'Folder'),
+                    self._build(content)))
+            else:
+                if not isinstance(content, dict):
+                    content = {'Password': content}
+                nodes.append((StubEntry(name, 'Generic', content), []))
+        return nodes
+
+    def connect(self, signal, callback, *args):
+        return 0
+
+    def get_iter_first(self):
+        return (self.root, 0) if self.root else None
+
+    def iter_next(self, itera):
+        siblings, index = itera
+        return (siblings, index + 1) if index + 1 < len(siblings) else None
+
+    def iter_children(self, itera):
+        if itera is None:
+            return self.get_iter_first()
+        children = itera[0][itera[1]][1]
+        return (children, 0) if children else None
+
+    def iter_has_child(self, itera):
+        return bool(itera[0][itera[1]][1])
+
+    def get_value(self, itera, column):
+        return itera[0][itera[1]][0]
+
+
+def make_stub_store(tree):
+    """ Returns a read-only EntrySnapshot of the given tree, which does
+    not need revelation nor GTK.
+    :arg tree, a list of (name, password) or (name, {field: value}) for
+    the passwords and of (name, children) for the folders, children being
+    a list as well.
+    """
+    import revelationcli
+    return revelationcli.EntrySnapshot(StubStore(tree))
+
+
+def make_store(tree, parent=None, store=None):
+    """ Returns an EntryStore holding the given tree.
+    :arg tree, a list of (name, password) for the passwords and of
+    (name, children) for the folders, children being a list as well.
+    :kwarg parent, the iterator of the folder in which to add the tree.
+    :kwarg store, the EntryStore to add the tree to.
+    """
+    if store is None:
+        store = data.EntryStore()
+    for name, content in tree:
+        if isinstance(content, list):
+            folder = entry.FolderEntry()
+            folder.name = name
+            make_store(content, store.add_entry(folder, parent), store)
+        else:
+            password = entry.GenericEntry()
+            password.name = name
+            for field in password.fields:
+                if field.name == 'Password':
+                    field.value = content
+            store.add_entry(password, parent)
+    return store
+
+
+def get_password(store, *path):
+    """ Returns the password of the entry at the given path of the
+    EntryStore, None if there is no such entry.
+    :arg store, the EntryStore to search.
+    :arg path, the names of the folders and of the entry.
+    """
+    itera = store.get_iter_first()
+    for cnt, name in enumerate(path):
+        while itera is not None and store.get_value(itera, 2).name != name:
+            itera = store.iter_next(itera)
+        if itera is None:
+            return None
+        if cnt < len(path) - 1:
+            itera = store.iter_children(itera)
+    for field in store.get_value(itera, 2).fields:
+        if field.name == 'Password':
+            return field.value
+
+
+def capture_output(func, *args, **kwargs):
+    """ Call the given function and returns the lines it printed.
+    :arg func, the function to call with the other arguments.
+    """
+    stdout = sys.stdout
+    sys.stdout = tempfile.TemporaryFile()
+    try:
+        func(*args, **kwargs)
+        sys.stdout.seek(0)
+        return sys.stdout.read().splitlines()
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
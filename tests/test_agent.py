@@ -0,0 +1,81 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the agent keeping the database unlocked.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import json
+import unittest
+
+from helpers import make_stub_store
+
+import revelationcli
+
+
+class AgentTests(unittest.TestCase):
+    """ Check the answers of the agent to the lookups. """
+
+    def setUp(self):
+        cli = revelationcli.RevelationCli()
+        cli.dbfiles = []
+        cli.passwords = make_stub_store([
+            ('Caf\xc3\xa9', 'p\xc3\xa9w'), ('mail', 'secret')])
+        self.agent = revelationcli.RevelationAgent(cli, 60)
+
+    def _lookup(self, name):
+        """ Returns the entries found by the agent for the given name, the
+        request and the answer going through JSON as on the socket.
+        :arg name, the name to look up.
+        """
+        request = json.loads(json.dumps({'databases': [], 'name': name}))
+        answer = json.loads(json.dumps(self.agent.answer(request)))
+        return [revelationcli.AgentEntry(entry['name'], entry['fields'])
+            for entry in answer['entries']]
+
+    def test_lookup(self):
+        """ A password is found by its name. """
+        entries = self._lookup('mail')
+        self.assertEqual([entry.name for entry in entries], ['mail'])
+
+    def test_lookup_non_ascii(self):
+        """ A name which is not ASCII is found and given back encoded. """
+        entries = self._lookup('Caf\xc3\xa9')
+        self.assertEqual([entry.name for entry in entries], ['Caf\xc3\xa9'])
+        self.assertEqual([field.value for field in entries[0].fields],
+            ['p\xc3\xa9w'])
+
+    def test_secret_fields(self):
+        """ The fields keep their datatype, the ones without are secret. """
+        entry = self._lookup('mail')[0]
+        self.assertEqual([field.datatype for field in entry.fields],
+            ['password'])
+        entry = revelationcli.AgentEntry(u'mail', [(u'PIN', u'1234')])
+        self.assertTrue(revelationcli.is_secret(entry.fields[0]))
+
+    def test_other_database(self):
+        """ Lookups for another database are refused. """
+        self.assertTrue('error' in self.agent.answer(
+            {'databases': ['other.rvl'], 'name': 'mail'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the audit of the passwords.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from helpers import capture_output, make_stub_store
+
+import revelationcli
+
+
+class PasswordWeaknessesTests(unittest.TestCase):
+    """ Check the reasons given for weak passwords. """
+
+    def test_strong(self):
+        """ Long passwords mixing kinds of characters are fine. """
+        self.assertEqual(revelationcli.password_weaknesses('Str0ng!Pass#'),
+            [])
+        self.assertEqual(revelationcli.password_weaknesses('correct7horse'
+            'BATTERY'), [])
+
+    def test_short(self):
+        """ Passwords of less than 8 characters are short. """
+        self.assertEqual(revelationcli.password_weaknesses('aB3$xyz'),
+            ['short'])
+
+    def test_kinds(self):
+        """ Passwords must mix at least three kinds of characters. """
+        self.assertEqual(revelationcli.password_weaknesses('12345678901'),
+            ['1 kind(s) of characters'])
+        self.assertEqual(revelationcli.password_weaknesses('abcdefgh12'),
+            ['2 kind(s) of characters'])
+
+    def test_common(self):
+        """ Common passwords and repeated characters are reported. """
+        self.assertEqual(revelationcli.password_weaknesses('Password'),
+            ['2 kind(s) of characters', 'common'])
+        self.assertTrue('common' in
+            revelationcli.password_weaknesses('aaaaaaaa1111'))
+
+
+class AuditTests(unittest.TestCase):
+    """ Check the report of the audit. """
+
+    def setUp(self):
+        self.cli = revelationcli.RevelationCli()
+        self.cli.passwords = make_stub_store([
+            ('Servers', [('db', 'Reused!Pass1'), ('web', 'Reused!Pass1')]),
+            ('mail', 'abc'),
+            ('card', {'Username': 'me', 'PIN': '1234'}),
+            ('bank', 'Str0ng!Pass#'),
+        ])
+
+    def test_report(self):
+        """ Reused and weak passwords are listed without their value. """
+        self.assertEqual(capture_output(self.cli.audit), [
+            'Passwords used more than once:',
+            '  2 entries',
+            '    /Servers/db',
+            '    /Servers/web',
+            'Weak passwords:',
+            '  /mail: short, 1 kind(s) of characters',
+            '  /card: short, 1 kind(s) of characters',
+            '5 passwords, 2 reused, 2 weak, 0 old',
+        ])
+
+    def test_show(self):
+        """ The passwords are given with --show. """
+        lines = capture_output(self.cli.audit, show=True)
+        self.assertEqual(lines[1], '  2 entries (Reused!Pass1)')
+        self.assertEqual(lines[5],
+            '  /mail: short, 1 kind(s) of characters (abc)')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the encrypted cache of the tree of the databases.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from helpers import HAS_REVELATION, get_password, make_store
+
+import revelationcli
+
+try:
+    import Crypto
+except ImportError:
+    Crypto = None
+
+
+@unittest.skipUnless(HAS_REVELATION and Crypto,
+    'revelation or PyCrypto is not installed')
+class TreeCacheTests(unittest.TestCase):
+    """ Check that the cache only gives back the tree for the same
+    database and password.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfile = os.path.join(self.tmpdir, 'test.rvl')
+        self.dbdata = 'content of the database'
+        revelationcli.write_atomic(self.dbfile, self.dbdata)
+        self.cache = revelationcli.TreeCache(self.dbfile)
+        self.cache.filename = os.path.join(self.tmpdir, 'test.cache')
+        self.store = make_store([('Servers', [('db', 'secret')]),
+            ('mail', 'other')])
+        self.cache.save(self.store, self.dbdata, 'pw')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load(self):
+        """ The tree is read back with the right password. """
+        store = self.cache.load(self.dbdata, 'pw')
+        self.assertEqual(get_password(store, 'Servers', 'db'), 'secret')
+        self.assertEqual(get_password(store, 'mail'), 'other')
+
+    def test_no_secret_in_clear(self):
+        """ The passwords are not written in clear text. """
+        cached = revelationcli.read_file(self.cache.filename)
+        self.assertFalse('secret' in cached)
+
+    def test_wrong_password(self):
+        """ Nothing is read back with another password. """
+        self.assertEqual(self.cache.load(self.dbdata, 'other'), None)
+
+    def test_database_changed(self):
+        """ Nothing is read back once the database changed. """
+        revelationcli.write_atomic(self.dbfile, 'new content')
+        self.assertEqual(self.cache.load('new content', 'pw'), None)
+
+    def test_tampered(self):
+        """ Nothing is read back from a modified cache. """
+        cached = revelationcli.read_file(self.cache.filename)
+        revelationcli.write_atomic(self.cache.filename,
+            cached[:-1] + chr(ord(cached[-1]) ^ 1))
+        self.assertEqual(self.cache.load(self.dbdata, 'pw'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the comparison and the merge of two databases.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from helpers import HAS_REVELATION, capture_output, datahandler, \
+    get_password, make_store
+
+import revelationcli
+
+
+@unittest.skipUnless(HAS_REVELATION, 'revelation is not installed')
+class DiffTests(unittest.TestCase):
+    """ Check the differences found between two databases and their
+    merge.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.other = os.path.join(self.tmpdir, 'other.rvl')
+        revelationcli.write_atomic(self.other,
+            datahandler.RevelationXML().export_data(make_store([
+                ('Servers', [('db', 'changed'), ('dns', 'new')]),
+                ('mail', 'same'),
+                ('Team', [('wiki', 'added')])])))
+        self.cli = revelationcli.RevelationCli()
+        self.cli.passwords = make_store([
+            ('Servers', [('db', 'old'), ('web', 'kept')]),
+            ('mail', 'same')])
+        self.cli.handler = datahandler.RevelationXML
+        self.cli.password = 'pw'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _diff(self, merge=None):
+        """ Returns the lines printed by the diff with the other database.
+        :kwarg merge, the file into which the merge is saved.
+        """
+        return capture_output(self.cli.diff, self.other, merge)
+
+    def test_diff(self):
+        """ The entries added, removed and changed are listed. """
+        self.assertEqual(self._diff(), ['+ /Servers/dns', '+ /Team',
+            '+ /Team/wiki', '- /Servers/web', '~ /Servers/db',
+            '3 added, 1 removed, 1 changed'])
+
+    def test_merge(self):
+        """ The merge has the entries of both databases, the changed ones
+        taken from the other database.
+        """
+        merge = os.path.join(self.tmpdir, 'merge.rvl')
+        self._diff(merge)
+        merged = datahandler.RevelationXML().import_data(
+            revelationcli.read_file(merge))
+        self.assertEqual(get_password(merged, 'Servers', 'db'), 'changed')
+        self.assertEqual(get_password(merged, 'Servers', 'web'), 'kept')
+        self.assertEqual(get_password(merged, 'Servers', 'dns'), 'new')
+        self.assertEqual(get_password(merged, 'Team', 'wiki'), 'added')
+        self.assertEqual(get_password(merged, 'mail'), 'same')
+        # No temporary file is left next to the merge
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+            ['merge.rvl', 'other.rvl'])
+
+    def test_merge_type_changed(self):
+        """ An entry which became or stopped being a folder is replaced
+        along with its children.
+        """
+        self.cli.passwords = make_store([('Servers', [('db', 'old')]),
+            ('mail', 'same')])
+        revelationcli.write_atomic(self.other,
+            datahandler.RevelationXML().export_data(make_store([
+                ('Servers', 'now a password'),
+                ('mail', [('imap', 'now a folder')])])))
+        merge = os.path.join(self.tmpdir, 'merge.rvl')
+        self._diff(merge)
+        merged = datahandler.RevelationXML().import_data(
+            revelationcli.read_file(merge))
+        self.assertEqual(get_password(merged, 'Servers'), 'now a password')
+        cli = revelationcli.RevelationCli()
+        cli.passwords = merged
+        self.assertEqual(merged.iter_children(
+            cli.find_password('Servers')[0]), None)
+        self.assertEqual(get_password(merged, 'mail', 'imap'),
+            'now a folder')
+
+    def test_merge_name_with_slash(self):
+        """ An entry whose name contains a / is added in its folder. """
+        self.cli.passwords = make_store([('a', [('c', 'kept')])])
+        revelationcli.write_atomic(self.other,
+            datahandler.RevelationXML().export_data(make_store([
+                ('a', [('c', 'kept')]), ('a/b', 'slash')])))
+        merge = os.path.join(self.tmpdir, 'merge.rvl')
+        self._diff(merge)
+        merged = datahandler.RevelationXML().import_data(
+            revelationcli.read_file(merge))
+        self.assertEqual(get_password(merged, 'a/b'), 'slash')
+        self.assertEqual(get_password(merged, 'a', 'b'), None)
+
+    def test_merge_not_written(self):
+        """ A merge which can not be written is reported as such. """
+        merge = os.path.join(self.tmpdir, 'missing', 'merge.rvl')
+        merged = []
+        lines = capture_output(lambda: merged.append(
+            self.cli.diff(self.other, merge)))
+        self.assertEqual(merged, [False])
+        self.assertTrue(lines[-1].startswith('The merge could not be '
+            'written'))
+
+    def test_same_names(self):
+        """ Entries of the same name in a folder are told apart. """
+        hashes, order = revelationcli.hash_entries(make_store([
+            ('mail', 'first'), ('mail', 'second')]))
+        self.assertEqual(order, ['/mail', '/mail[2]'])
+        self.assertNotEqual(hashes['/mail'][0], hashes['/mail[2]'][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the export of the entries and of the batch lookups.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import csv
+import json
+import unittest
+
+from helpers import capture_output, make_stub_store
+
+import revelationcli
+
+TREE = [
+    ('Bank', [('card', {'Username': 'me', 'Password': 'secret',
+        'PIN': '1234'})]),
+    ('mail', {'Username': 'user', 'Password': 'other'}),
+]
+
+
+class ExportTests(unittest.TestCase):
+    """ Check that the secret fields are only given with --show. """
+
+    def setUp(self):
+        self.cli = revelationcli.RevelationCli()
+        self.cli.passwords = make_stub_store(TREE)
+        self.cli.show = False
+
+    def _export_json(self):
+        return [json.loads(line) for line in
+            capture_output(self.cli.export, 'json')]
+
+    def test_export_json(self):
+        """ The secret fields are not exported. """
+        self.assertEqual([(record['path'], record['fields'])
+            for record in self._export_json()], [
+            ('/Bank', {}),
+            ('/Bank/card', {'Username': 'me'}),
+            ('/mail', {'Username': 'user'}),
+        ])
+
+    def test_export_json_show(self):
+        """ The secret fields are exported with --show. """
+        self.cli.show = True
+        self.assertEqual(self._export_json()[1]['fields'],
+            {'Username': 'me', 'Password': 'secret', 'PIN': '1234'})
+
+    def test_export_csv(self):
+        """ The columns are the fields of all the entries. """
+        rows = list(csv.reader(capture_output(self.cli.export, 'csv')))
+        self.assertEqual(rows, [
+            ['Path', 'Type', 'Description', 'Username'],
+            ['/Bank', 'Folder', '', ''],
+            ['/Bank/card', 'Generic', '', 'me'],
+            ['/mail', 'Generic', '', 'user'],
+        ])
+
+    def test_batch(self):
+        """ The batch only gives the secret fields with --show. """
+        records = [json.loads(line) for line in
+            capture_output(self.cli.run_batch, ['card'])]
+        self.assertEqual(records[0]['entries'][0]['fields'],
+            {'Username': 'me'})
+        self.cli.show = True
+        records = [json.loads(line) for line in
+            capture_output(self.cli.run_batch, ['card'])]
+        self.assertEqual(records[0]['entries'][0]['fields']['PIN'], '1234')
+
+    def test_print_password(self):
+        """ The entries printed hide their secret fields. """
+        entry = self.cli.passwords.get_value(
+            self.cli.find_password('card')[0], 2)
+        self.assertEqual(capture_output(self.cli._print_password, entry),
+            ['  Name : card', '  Username : me'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the lookup of the passwords by name or path.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from helpers import make_stub_store
+
+import revelationcli
+
+TREE = [
+    ('Servers', [
+        ('Prod', [('db', 'prod-db'), ('web', 'prod-web')]),
+        ('db', 'staging-db'),
+    ]),
+    ('a/b', 'slash'),
+    ('https://example.org', 'url'),
+    ('mail', 'mail'),
+]
+
+
+class FindPasswordTests(unittest.TestCase):
+    """ Check find_password and resolve_batch. """
+
+    def setUp(self):
+        self.cli = revelationcli.RevelationCli()
+        self.cli.passwords = make_stub_store(TREE)
+
+    def _passwords(self, iters):
+        return [self.cli.passwords.get_value(itera, 2).fields[0].value
+            for itera in iters]
+
+    def test_name(self):
+        """ A name matches its first occurrence in the tree. """
+        self.assertEqual(self._passwords(self.cli.find_password('db')),
+            ['prod-db'])
+
+    def test_path(self):
+        """ A path only matches the entry at this path. """
+        self.assertEqual(self._passwords(
+            self.cli.find_password('Servers/db')), ['staging-db'])
+        self.assertEqual(self._passwords(
+            self.cli.find_password('/Servers/Prod/web')), ['prod-web'])
+
+    def test_name_with_slash(self):
+        """ A name containing / is found when it is not a path. """
+        self.assertEqual(self._passwords(self.cli.find_password('a/b')),
+            ['slash'])
+        self.assertEqual(self._passwords(
+            self.cli.find_password('https://example.org')), ['url'])
+
+    def test_not_found(self):
+        """ Nothing is returned for unknown names and paths. """
+        self.assertEqual(self.cli.find_password('nope'), [])
+        self.assertEqual(self.cli.find_password('Servers/nope'), [])
+        self.assertEqual(self.cli.find_password('/'), [])
+
+    def test_batch(self):
+        """ The batch resolves the queries as find_password does. """
+        queries = ['db', 'Servers/db', 'a/b', 'Servers/Prod/web', 'nope',
+            'db']
+        results = self.cli.resolve_batch(queries)
+        self.assertEqual(sorted(results), sorted(set(queries)))
+        self.assertEqual([(query, [path for path, _ in results[query]])
+            for query in queries], [
+            ('db', ['/Servers/Prod/db']),
+            ('Servers/db', ['/Servers/db']),
+            ('a/b', ['/a/b']),
+            ('Servers/Prod/web', ['/Servers/Prod/web']),
+            ('nope', []),
+            ('db', ['/Servers/Prod/db']),
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()
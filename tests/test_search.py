@@ -0,0 +1,81 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the search of the entries by their words.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from helpers import make_stub_store
+
+import revelationcli
+
+TREE = [
+    ('Servers', [
+        ('db-prod', {'Username': 'postgres', 'Hostname': 'db1.example.org',
+            'Password': 'hunter2'}),
+        ('web-prod', {'Username': 'www', 'Hostname': 'web1.example.org',
+            'Password': 'hunter3'}),
+    ]),
+    ('Mail', {'Username': 'Postmaster', 'Password': 'secret'}),
+]
+
+
+class SearchIndexTests(unittest.TestCase):
+    """ Check the words matched by the search. """
+
+    def setUp(self):
+        self.index = revelationcli.SearchIndex(make_stub_store(TREE))
+
+    def _search(self, query):
+        return [path for path, _ in self.index.search(query)]
+
+    def test_prefix(self):
+        """ The terms match the start of the words, whatever their case. """
+        self.assertEqual(self._search('post'),
+            ['/Servers/db-prod', '/Mail'])
+        self.assertEqual(self._search('EXAMPLE'),
+            ['/Servers/db-prod', '/Servers/web-prod'])
+
+    def test_all_terms(self):
+        """ The entries must match every term. """
+        self.assertEqual(self._search('prod post'), ['/Servers/db-prod'])
+        self.assertEqual(self._search('web example'), ['/Servers/web-prod'])
+        self.assertEqual(self._search('web mail'), [])
+
+    def test_names(self):
+        """ The names of the folders are searched as well. """
+        self.assertEqual(self._search('serv'), ['/Servers'])
+
+    def test_secrets(self):
+        """ The secret fields are not searched. """
+        self.assertEqual(self._search('hunter'), [])
+        self.assertEqual(self._search('secret'), [])
+
+    def test_empty(self):
+        """ An empty query matches nothing. """
+        self.assertEqual(self._search(''), [])
+        self.assertEqual(self._search(' - '), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
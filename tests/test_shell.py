@@ -0,0 +1,205 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the interactive shell of revelationcli.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from helpers import HAS_REVELATION, capture_output, datahandler, \
+    get_password, make_store, make_stub_store
+
+import revelationcli
+
+
+class CompletionTests(unittest.TestCase):
+    """ Check the completion of the paths given to the commands. """
+
+    def setUp(self):
+        self.shell = revelationcli.RevelationInteractive(make_stub_store([
+            ('Servers', [('Prod', [('db', 'a'), ('dns', 'b')]),
+                ('Preprod', []), ('proxy', 'c')]),
+            ('Stuff', []),
+            ('mail', 'd'),
+        ]), None, None, clipboard='memory')
+
+    def _complete(self, command, text, line):
+        return getattr(self.shell, 'complete_' + command)(text, line,
+            len(line) - len(text), len(line))
+
+    def test_folder(self):
+        """ cd only completes the folders. """
+        self.assertEqual(self._complete('cd', 'S', 'cd S'),
+            ['Servers/', 'Stuff/'])
+        self.assertEqual(self._complete('cd', 'm', 'cd m'), [])
+
+    def test_passwords(self):
+        """ view completes the folders and the passwords. """
+        self.assertEqual(self._complete('view', '', 'view '),
+            ['Servers/', 'Stuff/', 'mail'])
+
+    def test_path(self):
+        """ The text replaced may start at the folder or after it,
+        depending on the delimiters of readline.
+        """
+        self.assertEqual(self._complete('view', 'Servers/P',
+            'view Servers/P'), ['Servers/Preprod/', 'Servers/Prod/'])
+        self.assertEqual(self._complete('view', 'P', 'view Servers/P'),
+            ['Preprod/', 'Prod/'])
+        self.assertEqual(self._complete('view', 'd', 'view Servers/Prod/d'),
+            ['db', 'dns'])
+
+    def test_relative(self):
+        """ The paths are completed from the current folder. """
+        self.shell.do_cd('Servers')
+        self.assertEqual(self._complete('view', 'p', 'view p'), ['proxy'])
+        self.assertEqual(self._complete('cd', '../S', 'cd ../S'),
+            ['../Servers/', '../Stuff/'])
+
+
+class ReloadTests(unittest.TestCase):
+    """ Check when the database is reloaded after it changed on the
+    disk.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfile = os.path.join(self.tmpdir, 'test.rvl')
+        revelationcli.write_atomic(self.dbfile, 'content')
+        self.shell = revelationcli.RevelationInteractive(
+            make_stub_store([('mail', 'secret')]), self.dbfile, None,
+            password='pw', clipboard='memory')
+        self.reloads = []
+        self.shell.reload = self._reload
+        self.failures = 0
+        revelationcli.write_atomic(self.dbfile, 'changed content')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _reload(self):
+        self.reloads.append(self.dbfile)
+        if self.failures:
+            self.failures -= 1
+            raise IOError('File being written')
+
+    def test_reload(self):
+        """ The database is reloaded once after it changed. """
+        capture_output(self.shell._check_reload)
+        capture_output(self.shell._check_reload)
+        self.assertEqual(len(self.reloads), 1)
+
+    def test_modified(self):
+        """ The database is not reloaded over changes made here. """
+        self.shell.modified = True
+        capture_output(self.shell._check_reload)
+        self.assertEqual(self.reloads, [])
+
+    def test_autosave_pending(self):
+        """ Changes waiting for the autosave count as modifications. """
+        self.shell.autosave_pending = (None, self.dbfile, 'pw')
+        capture_output(self.shell._check_reload)
+        self.assertEqual(self.reloads, [])
+
+    def test_failed_reload(self):
+        """ A reload which failed is tried again. """
+        self.failures = 1
+        capture_output(self.shell._check_reload)
+        capture_output(self.shell._check_reload)
+        capture_output(self.shell._check_reload)
+        self.assertEqual(len(self.reloads), 2)
+
+
+@unittest.skipUnless(HAS_REVELATION, 'revelation is not installed')
+class AutosaveTests(unittest.TestCase):
+    """ Check the automatic saves of the database. """
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.dbfile = os.path.join(self.tmpdir, 'test.rvl')
+        store = make_store([('mail', 'secret')])
+        revelationcli.write_atomic(self.dbfile,
+            datahandler.RevelationXML().export_data(store))
+        self.shell = revelationcli.RevelationInteractive(
+            make_store([('mail', 'changed')]), self.dbfile,
+            datahandler.RevelationXML, autosave=3600, password='pw',
+            clipboard='memory')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_quit_saves_pending_changes(self):
+        """ Quitting before the autosave delay saves the changes. """
+        self.shell.modified = True
+        self.shell.postcmd(False, 'edit mail')
+        self.assertTrue(self.shell.autosave_timer is not None)
+        self.assertRaises(SystemExit, self.shell.do_quit, None)
+        saved = datahandler.RevelationXML().import_data(
+            revelationcli.read_file(self.dbfile))
+        self.assertEqual(get_password(saved, 'mail'), 'changed')
+
+
+class ClipboardTests(unittest.TestCase):
+    """ Check the copy of the passwords to the clipboard. """
+
+    def setUp(self):
+        self.shell = revelationcli.RevelationInteractive(
+            make_stub_store([('Servers', [('db', 'secret')])]), None, None,
+            clipboard='memory', clipboard_timeout=0.01)
+
+    def test_copy_and_clear(self):
+        """ The password copied is cleared after the timeout. """
+        self.shell.do_copy('/Servers/db')
+        self.assertEqual(self.shell.clipboard.content, 'secret')
+        self.shell.clipboard_timer.join()
+        self.assertEqual(self.shell.clipboard.content, '')
+
+    def test_clear_on_quit(self):
+        """ The password copied is cleared when quitting. """
+        self.shell.clipboard_timeout = 3600
+        self.shell.do_copy('/Servers/db')
+        self.assertRaises(SystemExit, self.shell.do_quit, None)
+        self.assertEqual(self.shell.clipboard.content, '')
+
+    def test_copy_not_cleared(self):
+        """ A clipboard which can not be cleared is refused with a
+        timeout.
+        """
+        self.shell.clipboard = revelationcli.MemoryClipboard()
+        self.shell.clipboard.threadsafe = False
+        self.shell.do_copy('/Servers/db')
+        self.assertEqual(self.shell.clipboard.content, '')
+        self.shell.clipboard_timeout = 0
+        self.shell.do_copy('/Servers/db')
+        self.assertEqual(self.shell.clipboard.content, 'secret')
+
+    def test_copy_unknown(self):
+        """ Nothing is copied for an unknown entry. """
+        self.shell.do_copy('/Servers/web')
+        self.assertEqual(self.shell.clipboard, None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Start-up time tests of the entry points of revelationcli.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+# Modules which are slow to import and only needed once a database is
+# opened or the clipboard used
+HEAVY_MODULES = ['revelation', 'gtk', 'gobject', 'Tkinter',
+    'multiprocessing', 'Crypto']
+# Maximum time in seconds for an entry point to print its help
+STARTUP_BUDGET = 1.0
+
+RUN_HELP = '''
+import runpy
+import sys
+sys.argv = [%r, '--help']
+sys.path.insert(0, %r)
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+except SystemExit:
+    pass
+sys.stderr.write(' '.join(name for name in %r if name in sys.modules))
+'''
+
+
+class StartupTests(unittest.TestCase):
+    """ Check that printing the help of the entry points does not import
+    the heavy modules and stays fast.
+    """
+
+    def _run_help(self, script):
+        """ Run the given script with --help and returns the time it took
+        along with the heavy modules it imported.
+        :arg script, the name of the script in the repository.
+        """
+        script = os.path.join(ROOT, script)
+        start = time.time()
+        proc = subprocess.Popen([sys.executable, '-c',
+            RUN_HELP % (script, ROOT, HEAVY_MODULES)],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        _, imported = proc.communicate()
+        return time.time() - start, imported.split()
+
+    def test_revelationcli_help(self):
+        """ revelationcli.py --help """
+        duration, imported = self._run_help('revelationcli.py')
+        self.assertEqual(imported, [])
+        self.assertTrue(duration < STARTUP_BUDGET,
+            'Start-up took %.2fs' % duration)
+
+    def test_benchmark_help(self):
+        """ benchmark.py --help """
+        duration, imported = self._run_help('benchmark.py')
+        self.assertEqual(imported, [])
+        self.assertTrue(duration < STARTUP_BUDGET,
+            'Start-up took %.2fs' % duration)
+
+
+if __name__ == '__main__':
+    unittest.main()
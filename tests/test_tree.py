@@ -0,0 +1,146 @@
+#!/usr/bin/python
+#-*- coding: utf-8 -*-
+
+"""
+Tests of the browsing and the printing of the tree of entries.
+
+
+Copyright (c) 2011-2012 Pierre-Yves Chibon <pingou AT pingoured DOT fr>
+
+This file is part of revelationcli.
+
+revelationcli is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+revelationcli is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with revelationcli.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+import unittest
+
+from helpers import capture_output, make_stub_store
+
+import revelationcli
+
+TREE = [
+    ('Servers', [
+        ('Prod', [('db', 'a'), ('web', 'b')]),
+        ('staging', 'c'),
+    ]),
+    ('Empty', []),
+    ('mail', 'd'),
+]
+
+
+class WalkEntriesTests(unittest.TestCase):
+    """ Check walk_entries. """
+
+    def setUp(self):
+        self.passwords = make_stub_store(TREE)
+
+    def _walk(self, **kwargs):
+        return [(depth, entry.name) for depth, entry, _ in
+            revelationcli.walk_entries(self.passwords,
+                self.passwords.get_iter_first(), **kwargs)]
+
+    def test_order(self):
+        """ The entries come in the order of the tree with their depth. """
+        self.assertEqual(self._walk(), [(0, 'Servers'), (1, 'Prod'),
+            (2, 'db'), (2, 'web'), (1, 'staging'), (0, 'Empty'),
+            (0, 'mail')])
+
+    def test_max_depth(self):
+        """ Only the given number of levels are browsed. """
+        self.assertEqual(self._walk(max_depth=1),
+            [(0, 'Servers'), (0, 'Empty'), (0, 'mail')])
+        self.assertEqual(self._walk(max_depth=2), [(0, 'Servers'),
+            (1, 'Prod'), (1, 'staging'), (0, 'Empty'), (0, 'mail')])
+
+    def test_folder_only(self):
+        """ Only the folders are returned. """
+        self.assertEqual(self._walk(folder_only=True),
+            [(0, 'Servers'), (1, 'Prod'), (0, 'Empty')])
+
+    def test_not_recursive(self):
+        """ Only the siblings are returned. """
+        self.assertEqual(self._walk(recursive=False),
+            [(0, 'Servers'), (0, 'Empty'), (0, 'mail')])
+
+
+class ShowTreeTests(unittest.TestCase):
+    """ Check the tree printed. """
+
+    def setUp(self):
+        self.cli = revelationcli.RevelationCli()
+        self.cli.passwords = make_stub_store(TREE)
+
+    def test_depth(self):
+        """ The tree is cut at the given depth. """
+        self.assertEqual(capture_output(self.cli.show_tree, depth=1), [
+            'Database:',
+            '  | \\_ [] Servers',
+            '  | \\_ [] Empty',
+            '  | \\_  mail',
+        ])
+
+    def test_limit(self):
+        """ The tree stops after the given number of entries. """
+        self.assertEqual(capture_output(self.cli.show_tree, limit=2), [
+            'Database:',
+            '  | \\_ [] Servers',
+            '  |   | \\_ [] Prod',
+            '  ... (limited to 2 entries)',
+        ])
+
+    def test_limit_not_reached(self):
+        """ Nothing is said when the tree is shorter than the limit. """
+        lines = capture_output(self.cli.show_tree, limit=7)
+        self.assertEqual(len(lines), 8)
+        self.assertFalse('limited' in lines[-1])
+
+    def test_path(self):
+        """ Only the tree of the given folder is printed. """
+        self.assertEqual(capture_output(self.cli.show_tree,
+            path='Servers/Prod'), [
+            'Servers/Prod:',
+            '  | \\_  db',
+            '  | \\_  web',
+        ])
+        self.assertEqual(capture_output(self.cli.show_tree,
+            path='Servers/staging'), [])
+
+
+class PositiveIntTests(unittest.TestCase):
+    """ Check the validation of --depth, --limit and ls -d. """
+
+    def test_valid(self):
+        self.assertEqual(revelationcli.positive_int('1'), 1)
+        self.assertEqual(revelationcli.positive_int('12'), 12)
+
+    def test_invalid(self):
+        for value in ('0', '-2', 'two', ''):
+            self.assertRaises(revelationcli.argparse.ArgumentTypeError,
+                revelationcli.positive_int, value)
+
+    def test_ls(self):
+        """ ls refuses a depth lower than 1. """
+        shell = revelationcli.RevelationInteractive(make_stub_store(TREE),
+            None, None, clipboard='memory')
+        self.assertEqual(capture_output(shell.do_ls, '-d 0'),
+            ['Usage: ls [-d DEPTH] [FOLDER], DEPTH being 1 or more'])
+        self.assertEqual(capture_output(shell.do_ls, '-d 1'), [
+            '  | \\_ [] Servers',
+            '  | \\_ [] Empty',
+            '  | \\_  mail',
+        ])
+
+
+if __name__ == '__main__':
+    unittest.main()